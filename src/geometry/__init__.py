@@ -1,6 +1,6 @@
 __author__ = 'Konstantin Weddige'
 import math
-import itertools
+import numpy
 
 
 def distance(a, b):
@@ -13,10 +13,92 @@ def distance(a, b):
     return math.hypot(a[0] - b[0], a[1] - b[1])
 
 
+def _cross(o, a, b):
+    return (a[0] - o[0]) * (b[1] - o[1]) - (a[1] - o[1]) * (b[0] - o[0])
+
+
+def convex_hull(points):
+    """
+    Calculates the convex hull with Andrew's monotone chain algorithm in O(n log n).
+
+    Points inside the polygon of the extreme points in eight directions are discarded first
+    (Akl-Toussaint heuristic), so usually only a small fraction of the points is sorted.
+    :param points: list of (float, float) or array of shape (n, 2)
+    :return: list of (float, float), counterclockwise without collinear points
+    """
+    points = numpy.asarray(points, dtype=numpy.float64).reshape(-1, 2)
+    if len(points) > 8:
+        x, y = points[:, 0], points[:, 1]
+        extreme = list()
+        for value in (x, y, x + y, x - y):
+            extreme.extend((value.argmin(), value.argmax()))
+        polygon = points[numpy.unique(extreme)]
+        angle = numpy.arctan2(*(polygon - polygon.mean(axis=0)).T[::-1])
+        polygon = polygon[numpy.argsort(angle)]
+        if len(polygon) >= 3:
+            inside = numpy.ones(len(points), dtype=bool)
+            for a, b in zip(polygon, numpy.roll(polygon, -1, axis=0)):
+                inside &= (b[0] - a[0]) * (y - a[1]) - (b[1] - a[1]) * (x - a[0]) > 0
+            points = points[~inside]
+    # Sorted lexicographically
+    points = [tuple(p) for p in numpy.unique(points, axis=0).tolist()]
+    if len(points) < 3:
+        return points
+    lower = list()
+    for p in points:
+        while len(lower) >= 2 and _cross(lower[-2], lower[-1], p) <= 0:
+            lower.pop()
+        lower.append(p)
+    upper = list()
+    for p in reversed(points):
+        while len(upper) >= 2 and _cross(upper[-2], upper[-1], p) <= 0:
+            upper.pop()
+        upper.append(p)
+    return lower[:-1] + upper[:-1]
+
+
+def diameter(points):
+    """
+    Calculates the largest distance of two points with rotating calipers over the convex hull in O(n log n).
+    :param points: list of (float, float) or array of shape (n, 2)
+    :return: float
+    """
+    hull = convex_hull(points)
+    if len(hull) < 3:
+        return distance(hull[0], hull[-1]) if hull else 0
+    result = 0
+    j = 1
+    for i in range(len(hull)):
+        a, b = hull[i], hull[(i + 1) % len(hull)]
+        # Advance to the vertex farthest from the edge (a, b)
+        while _cross(a, b, hull[(j + 1) % len(hull)]) > _cross(a, b, hull[j]):
+            j = (j + 1) % len(hull)
+        result = max(result, distance(a, hull[j]), distance(b, hull[j]))
+    return result
+
+
 def d(points):
     """
-    Calculates d(points, B(0, 1)) in O(n²).
+    Calculates d(points, B(0, 1)), i.e. half the diameter, in O(n log n).
     :param points: list of (float, float)
     :return: float
     """
-    return max([distance(p, q) / 2 for p, q in itertools.combinations(points, 2)])
\ No newline at end of file
+    return diameter(points) / 2
+
+
+def cluster_d(points, label):
+    """
+    Calculates d(cluster, B(0, 1)) for every cluster of a labelled point set, e.g. by geometry.kcenter.assign.
+    :param points: list of (float, float) or array of shape (n, 2)
+    :param label: array of n non-negative ints
+    :return: array, indexed by label
+    """
+    points = numpy.asarray(points, dtype=numpy.float64)
+    label = numpy.asarray(label)
+    order = numpy.argsort(label, kind='stable')
+    count = numpy.bincount(label, minlength=0)
+    result = numpy.zeros(len(count))
+    for i, cluster in enumerate(numpy.split(points[order], numpy.cumsum(count)[:-1])):
+        if len(cluster) > 1:
+            result[i] = d(cluster)
+    return result
@@ -8,8 +8,15 @@ import logging
 import shapely.geometry
 import miniball
 import random
+import time
+import heapq
+import itertools
+import multiprocessing
+import numpy
+import scipy.spatial
 
 import geometry
+from utils.nearest import nearest_two, best_swap
 
 #import pyximport
 #pyximport.install()
@@ -19,116 +26,231 @@ import geometry
 logger = logging.getLogger(__name__)
 
 
+def assign(points, centers):
+    """Assigns every point to its nearest center. A kd-tree over the centers answers all queries in
+    one batch.
+
+    :param points: list of points or array of shape (n, 2)
+    :param centers: list of points
+    :return: radius, array of nearest centers, array of radii per center
+    """
+    distance, label = scipy.spatial.cKDTree(numpy.asarray(centers, dtype=numpy.float64)).query(
+        numpy.asarray(points, dtype=numpy.float64))
+    radii = numpy.zeros(len(centers))
+    numpy.maximum.at(radii, label, distance)
+    return float(distance.max()), label, radii
+
+
 def objective(points, centers):
     """Calculates the distance between points and centers.
 
     :param points: list of points
     :param centers: list of points
     :return: float"""
-    if centers and points:
-        return max([min([geometry.distance(p, c) for c in centers]) for p in points])
+    if len(centers) and len(points):
+        return assign(points, centers)[0]
     else:
         return 0
 
 
-def gonzalez(k, points, randomized=True):
+def gonzalez(k, points, randomized=True, bound=False):
     """This is an geometric version of Gonzalez's algorithm.
 
-    :param k: int
-    :param points: list of points
-    :return: list of points
-    """
+    The distance of every point to its nearest center is kept in an array and updated with one
+    vectorized minimum per new center.
 
-    def distance(a, b):
-        return math.sqrt((a[0] - b[0]) ** 2 + (a[1] - b[1]) ** 2)
+    The distance of the farthest point to the centers is known at the end of the run. It is the
+    radius of the result and, as the centers and that point have pairwise at least this distance,
+    the optimum is at least half of it. If bound is set, the distance is returned as well.
 
+    :param k: int
+    :param points: list of points or array of shape (n, 2)
+    :param bound: bool
+    :return: list of points or list of points and float
+    """
+    x, y = numpy.array(points, dtype=numpy.float64).T.copy()
     if randomized:
         index = random.choice(range(len(points)))
     else:
         index = 0
     result = [points[index]]
-    data = [(p, result[0], distance(p, result[0])) for p in points]  # O(n)
-    del data[index]
-    while len(result) < k:
-        furthest = max(range(len(data)), key=lambda i: data[i][2])
-        new_result = data[furthest][0]
-        del data[furthest]
-        for i in range(len(data)):
-            new_distance = distance(data[i][0], new_result)
-            if data[i][2] > new_distance:
-                data[i] = (data[i][0], new_result, new_distance)
-        result.append(new_result)
+    nearest = numpy.hypot(x - x[index], y - y[index])
+    # Centers are never chosen again
+    nearest[index] = -1
+    while len(result) < min(k, len(x)):
+        index = int(nearest.argmax())
+        result.append(points[index])
+        numpy.minimum(nearest, numpy.hypot(x - x[index], y - y[index]), out=nearest)
+        nearest[index] = -1
+    if bound:
+        return result, max(float(nearest.max()), 0)
     return result
 
 
-__recursion_depth = 0
-__recursions = 0
-__warnings = 0
-__stack_trace = None
-__result = None
-__skip_count = 0
+def local_search(points, centers, iterations=100, timeout=None, candidates=16):
+    """This function improves a solution, e.g. of gonzalez, by swapping centers with points.
 
-def brandenberg_roth(k, points, epsilon=1):
-    """This function calculates a geometric k-center by applying a branch-and-bound algorithm by René Brnadenberg
-    and Lucia Roth. See "New Algorithms for k-Center and Extensions" for details.
+    In every iteration up to candidates points around the point that determines the radius are tried
+    as replacement for every center. The best improving swap is applied. The search stops if there is
+    none or if the iteration or time budget is used up.
 
-    A 2-dimensional space and unit balls as containers are assumed.
+    :param points: list of points
+    :param centers: list of points
+    :param iterations: int
+    :param timeout: float, seconds
+    :param candidates: int
+    :return: list of points
+    """
+    start = time.perf_counter()
+    array = numpy.asarray(points, dtype=numpy.float64)
+    result = list(centers)
+
+    def distances(c):
+        return numpy.hypot(array[:, 0] - c[0], array[:, 1] - c[1])
+
+    distance = numpy.stack([distances(c) for c in result], axis=1)
+    for iteration in range(iterations):
+        if timeout is not None and time.perf_counter() - start > timeout:
+            break
+        nearest, label, second, _ = nearest_two(distance)
+        critical = int(nearest.argmax())
+        radius = nearest[critical]
+        # Only points closer to the critical point than its center can help
+        to_critical = distances(array[critical])
+        pool = numpy.flatnonzero(to_critical < radius)
+        pool = pool[numpy.argsort(to_critical[pool])]
+        pool = pool[numpy.linspace(0, len(pool) - 1, min(candidates, len(pool))).astype(int)]
+        best = None
+        for candidate in pool:
+            candidate_distance = distances(array[candidate])
+            candidate_radius, j = best_swap(nearest, label, second, candidate_distance, len(result))
+            if candidate_radius < radius:
+                radius = candidate_radius
+                best = candidate, j, candidate_distance
+        if best is None:
+            break
+        candidate, j, distance[:, j] = best
+        result[j] = points[candidate]
+    return result
+
+
+_TOLERANCE = 1e-9
+
+
+def _enclosing_ball(core, center, radius, support, p):
+    """Returns the smallest ball that encloses core and p, given the smallest ball of core.
+
+    If p is already covered, the ball does not change. Otherwise the ball is computed from the support
+    points of the old ball and p. If that does not cover core, it is computed from all points.
+
+    :param core: list of points
+    :param center: point
+    :param radius: float
+    :param support: list of points on the boundary of the ball of core
+    :param p: point
+    :return: center, radius, support points and the miniball, or None if the ball did not change
+    """
+    if core and geometry.distance(p, center) <= radius * (1 + _TOLERANCE):
+        return center, radius, support, None
+    points = core + [p]
+    array = numpy.asarray(points, dtype=numpy.float64)
+    for candidates in (support + [p], points):
+        mb = miniball.Miniball(candidates)
+        center = mb.center()
+        radius = math.sqrt(mb.squared_radius())
+        distance = numpy.hypot(array[:, 0] - center[0], array[:, 1] - center[1])
+        if candidates is points or (distance <= radius * (1 + _TOLERANCE) + _TOLERANCE).all():
+            support = [q for q, dist in zip(points, distance) if dist >= radius * (1 - _TOLERANCE)]
+            return center, radius, support, mb
+
+
+_State = collections.namedtuple('_State', ('core', 'remainings', 'rho', 'centers', 'distance', 'support',
+                                           'recursion_depth', 'uid', 'error'))
+_Result = collections.namedtuple('_Result', ('core', 'remainings', 'rho', 'centers',
+                                             'lower_bound', 'upper_bound', 'state'))
+
+
+def _publish(shared, upper_bound):
+    """Lowers the upper bound shared by all processes.
+
+    :param shared: multiprocessing.Value or None
+    :param upper_bound: float
+    """
+    if shared is not None and upper_bound < shared.value:
+        with shared.get_lock():
+            shared.value = min(shared.value, upper_bound)
+
+
+def _branch_and_bound(k, points, epsilon, states, upper_bound=float('inf'), result=None, frontier=None,
+                      shared=None, best_first=False, budget=None):
+    """Runs the search of brandenberg_roth on the given states.
 
     :param k: int
     :param points: list of points
     :param epsilon: float
-    :return: list of points
+    :param states: list of states
+    :param upper_bound: float
+    :param result: incumbent result
+    :param frontier: int, if set the states are expanded breadth first until there are as many
+    :param shared: multiprocessing.Value with the upper bound of all processes
+    :param best_first: bool, expand the state with the smallest lower bound first
+    :param budget: int, maximal number of expanded states
+    :return: best result or None, upper bound, statistics and the remaining states
     """
-    global __recursion_depth
-    global __recursions
-    global __warnings
-    global __skip_count
-    __recursion_depth, __recursions, __warnings, __skip_count = 0, 0, 0, 0
+    statistics = {'recursion_depth': 0, 'recursions': 0, 'warnings': 0, 'skip_count': 0, 'nodes': 0}
+    array = numpy.asarray(points, dtype=numpy.float64).reshape(-1, 2)
 
-    State = collections.namedtuple('State', ('core', 'remainings', 'rho', 'centers',
-                                             'recursion_depth', 'uid', 'error'))
-    Result = collections.namedtuple('Result', ('core', 'remainings', 'rho', 'centers',
-                                               'lower_bound', 'upper_bound', 'state'))
+    def distances(center):
+        return numpy.hypot(array[:, 0] - center[0], array[:, 1] - center[1])
 
-    upper_bound = float('inf')
-    # estimate = geometry.kcenter.gonzalez(k, points)
-    # rho_bound = objective(points, estimate)
-
-    stack = [
-        State(
-            [[] for i in range(k)],  # core
-            points,  # remainings
-            [0 for i in range(k)],  # rho
-            [(0,0) for i in range(k)],  # centers
-            0,  # recursion_depth
-            __recursions,  # __id
-            0,  # error
-        )
-    ]
-    result = None
+    # Ties are broken by depth, then by age
+    counter = itertools.count()
+    stack = list()
 
-    while stack:
-        state = stack.pop()
+    def push(state):
+        if best_first:
+            heapq.heappush(stack, (max(state.rho), -state.recursion_depth, next(counter), state))
+        else:
+            stack.append(state)
+
+    for state in states:
+        push(state)
+
+    while stack and (frontier is None or len(stack) < frontier):
+        if budget is not None and statistics['nodes'] >= budget:
+            break
+        if best_first:
+            state = heapq.heappop(stack)[-1]
+        else:
+            state = stack.pop(0 if frontier else -1)
+        statistics['nodes'] += 1
+        if shared is not None:
+            upper_bound = min(upper_bound, shared.value)
 
         lower_bound = max(state.rho)
 
         if lower_bound > (upper_bound * (1 + epsilon)) * (1 + state.error):
-            __skip_count += 1
+            # Neither this state nor its children can improve the result
+            statistics['skip_count'] += 1
+            continue
 
         # Are any points left?
-        if not state.remainings:
-            __recursion_depth = max(__recursion_depth, state.recursion_depth)
+        if not len(state.remainings):
+            statistics['recursion_depth'] = max(statistics['recursion_depth'], state.recursion_depth)
             # As no more points are left, the lower bound is an upper bound
             upper_bound = min(upper_bound, lower_bound)
+            _publish(shared, upper_bound)
             # current_objective < result.upper_bound
             if not result or lower_bound < result.upper_bound:
-                result = Result(state.core, state.remainings, state.rho, state.centers, lower_bound,
-                                lower_bound, state.uid)
+                result = _Result(state.core, state.remainings, state.rho, state.centers, lower_bound,
+                                 lower_bound, state.uid)
             continue
 
         # Compute delta and keep some results for later use
-        p = max(state.remainings, key=lambda p: objective([p], state.centers))
-        delta = {i: geometry.distance(p, state.centers[i]) for i in range(k)}
+        nearest = numpy.minimum.reduce(state.distance)
+        index = state.remainings[nearest[state.remainings].argmax()]
+        p = points[index]
+        delta = {i: state.distance[i][index] for i in range(k)}
 
         delta_min = min(delta.values())  # As k is usually small, this could be over-optimization
 
@@ -137,12 +259,13 @@ def brandenberg_roth(k, points, epsilon=1):
         #current_objective = objective(points, state.centers)
 
         upper_bound = min(upper_bound, current_objective)
+        _publish(shared, upper_bound)
 
         if (1 + epsilon) * lower_bound > upper_bound:#upper_bound: #delta_min:
-            __recursion_depth = max(__recursion_depth, state.recursion_depth)
+            statistics['recursion_depth'] = max(statistics['recursion_depth'], state.recursion_depth)
             if not result or current_objective < result.upper_bound: #  lower_bound < result.lower_bound:
-                result = Result(state.core, state.remainings, state.rho, state.centers, lower_bound,
-                                current_objective, state.uid)
+                result = _Result(state.core, state.remainings, state.rho, state.centers, lower_bound,
+                                 current_objective, state.uid)
             continue
         else:
             # Sort clusters descending by distance to p
@@ -155,34 +278,151 @@ def brandenberg_roth(k, points, epsilon=1):
                     else:
                         empty_set = True
                 # Recompute c, rho, core
-                # deepcopy calls are expensive!
-                core = [c[:] for c in state.core]
-                core[i].append(p)
-                remainings = state.remainings[:]
-                remainings.remove(p)
+                # deepcopy calls are expensive! Only the changed core is copied.
+                core = state.core[:]
+                core[i] = core[i] + [p]
+                remainings = state.remainings[state.remainings != index]
                 rho = state.rho[:]
                 centers = state.centers[:]
+                support = state.support[:]
 
-                mb = miniball.Miniball(core[i])
-                if not mb.is_valid():
+                centers[i], rho[i], support[i], mb = _enclosing_ball(state.core[i], state.centers[i], state.rho[i],
+                                                                     state.support[i], p)
+                if mb and not mb.is_valid():
                     logger.debug('Invalid miniball detected')
-                    __warnings += 1
-                rho[i] = math.sqrt(mb.squared_radius())
-                centers[i] = mb.center()
+                    statistics['warnings'] += 1
+                error = mb.relative_error() if mb else 0
 
-                if max(rho) <= (upper_bound * (1 + epsilon)) * (1 + mb.relative_error()):
+                if max(rho) <= (upper_bound * (1 + epsilon)) * (1 + error):
                     logger.debug('[{recursion_depth}] Add {p} to core[{0}]: {1}'.format(
                             i, rho[i], p=p, recursion_depth=state.recursion_depth))
-                    __recursions += 1
-                    new_state = State(core, remainings, rho, centers,
-                                      state.recursion_depth + 1, __recursions, mb.relative_error())
-                    stack.append(new_state)
-
-    if result:
-        logger.info('Objective bounded by {0} and {1}'.format(result.lower_bound, upper_bound))
-        return result.centers
+                    statistics['recursions'] += 1
+                    distance = list(state.distance)
+                    if mb:
+                        distance[i] = distances(centers[i])
+                    new_state = _State(core, remainings, rho, centers, tuple(distance), support,
+                                       state.recursion_depth + 1, statistics['recursions'], error)
+                    push(new_state)
+
+    if best_first:
+        stack = [entry[-1] for entry in stack]
+    return result, upper_bound, statistics, stack
+
+
+def _open_bound(states):
+    """Returns the smallest lower bound of states that are not searched yet.
+
+    :param states: list of states
+    :return: float
+    """
+    return min((max(state.rho) for state in states), default=float('inf'))
+
+
+_worker = dict()
+
+
+def _init_worker(k, points, epsilon, shared, best_first, budget):
+    _worker.update(k=k, points=points, epsilon=epsilon, shared=shared, best_first=best_first, budget=budget)
+
+
+def _solve_subtree(state):
+    result, upper_bound, statistics, stack = _branch_and_bound(
+        _worker['k'], _worker['points'], _worker['epsilon'], [state], _worker['shared'].value,
+        shared=_worker['shared'], best_first=_worker['best_first'], budget=_worker['budget'])
+    return result, upper_bound, statistics, _open_bound(stack)
+
+
+def brandenberg_roth(k, points, epsilon=1, processes=1, statistics=False, best_first=False, budget=None):
+    """This function calculates a geometric k-center by applying a branch-and-bound algorithm by René Brnadenberg
+    and Lucia Roth. See "New Algorithms for k-Center and Extensions" for details.
+
+    A 2-dimensional space and unit balls as containers are assumed.
+
+    Every state carries the indices of the remaining points and a tuple with the distances of all
+    points to each of its centers. A child only replaces the row of the center that moved and shares
+    the others, so the farthest remaining point is an argmax over the row-wise minimum. Also the
+    support points of every ball are kept, so a ball is only recomputed if the new point is not
+    covered, and then usually from its support points (see _enclosing_ball).
+
+    With more than one process, the top levels of the search tree are expanded breadth first and the
+    subtrees are searched on a process pool. The best upper bound is shared, so every process prunes
+    with the bounds found by the others.
+
+    If best_first is set, the states are kept in a heap and the one with the smallest lower bound is
+    expanded first. If best_first or budget is set, the result of gonzalez is the initial incumbent, so
+    pruning starts right away. After budget expanded states the search stops and returns the incumbent.
+    With a process pool every subtree gets its own budget, so up to about 4 * processes * budget states
+    are expanded in total. The statistics contain the lower bound proven so far and the gap, i.e.
+    upper_bound / lower_bound - 1.
+
+    :param k: int
+    :param points: list of points
+    :param epsilon: float
+    :param processes: int, None uses all CPUs
+    :param statistics: bool, also return a dict with statistics of the search
+    :param best_first: bool
+    :param budget: int
+    :return: list of points or list of points and dict
+    """
+    array = numpy.asarray(points, dtype=numpy.float64).reshape(-1, 2)
+    root = _State(
+        [[] for i in range(k)],  # core
+        numpy.arange(len(array)),  # remainings
+        [0 for i in range(k)],  # rho
+        [(0,0) for i in range(k)],  # centers
+        (numpy.hypot(array[:, 0], array[:, 1]), ) * k,  # distance
+        [[] for i in range(k)],  # support
+        0,  # recursion_depth
+        0,  # uid
+        0,  # error
+    )
+    upper_bound = float('inf')
+    incumbent = None
+    # The optimum is at least half the radius of gonzalez
+    lower_bound = 0
+    if best_first or budget is not None:
+        estimate, radius = gonzalez(k, points, randomized=False, bound=True)
+        upper_bound = radius
+        lower_bound = radius / 2
+        incumbent = _Result(None, None, None, estimate, lower_bound, radius, None)
+
+    if processes == 1:
+        result, upper_bound, stats, stack = _branch_and_bound(k, points, epsilon, [root], upper_bound, incumbent,
+                                                              best_first=best_first, budget=budget)
+        results = [result]
+        open_bound = _open_bound(stack)
     else:
+        processes = processes or multiprocessing.cpu_count()
+        result, upper_bound, stats, stack = _branch_and_bound(k, points, epsilon, [root], upper_bound, incumbent,
+                                                              frontier=4 * processes)
+        results = [result]
+        open_bound = float('inf')
+        if stack:
+            shared = multiprocessing.Value('d', upper_bound)
+            with multiprocessing.Pool(processes, _init_worker,
+                                      (k, points, epsilon, shared, best_first, budget)) as pool:
+                for result, bound, subtree, subtree_bound in pool.imap_unordered(_solve_subtree, stack):
+                    results.append(result)
+                    upper_bound = min(upper_bound, bound)
+                    open_bound = min(open_bound, subtree_bound)
+                    stats['recursion_depth'] = max(stats['recursion_depth'], subtree['recursion_depth'])
+                    for key in ('recursions', 'warnings', 'skip_count', 'nodes'):
+                        stats[key] += subtree[key]
+    results = [result for result in results if result]
+    if not results:
         raise ValueError('No result found')
+    result = min(results, key=lambda result: result.upper_bound)
+    # Every state that is not searched has its lower bound, all others are worse than upper_bound / (1 + epsilon)
+    lower_bound = max(lower_bound, min(open_bound, upper_bound / (1 + epsilon)))
+    logger.info('Objective bounded by {0} and {1}'.format(lower_bound, result.upper_bound))
+    if statistics:
+        if lower_bound > 0:
+            gap = result.upper_bound / lower_bound - 1
+        else:
+            gap = float('inf') if result.upper_bound > 0 else 0
+        stats.update(lower_bound=lower_bound, upper_bound=result.upper_bound, gap=gap)
+        return result.centers, stats
+    return result.centers
 
 
 approximate = gonzalez
@@ -0,0 +1,26 @@
+__author__ = 'Konstantin Weddige'
+import unittest
+import random
+import itertools
+
+import geometry
+
+
+class TestGeometry(unittest.TestCase):
+    def test_convex_hull(self):
+        input = [(0, 0), (2, 0), (2, 2), (0, 2), (1, 1), (1, 0), (0, 0)]
+        self.assertEqual(geometry.convex_hull(input), [(0, 0), (2, 0), (2, 2), (0, 2)])
+
+    def test_d(self):
+        rng = random.Random(0)
+        for n in (1, 2, 3, 10, 100):
+            input = [(rng.randint(0, 10), rng.random()) for i in range(n)]
+            expected = max([geometry.distance(p, q) / 2 for p, q in itertools.combinations(input, 2)], default=0)
+            self.assertAlmostEqual(geometry.d(input), expected)
+
+    def test_cluster_d(self):
+        input = [(0, 0), (5, 5), (2, 0), (6, 5)]
+        self.assertEqual(list(geometry.cluster_d(input, [0, 2, 0, 2])), [1, 0, 0.5])
+
+if __name__ == '__main__':
+    unittest.main()
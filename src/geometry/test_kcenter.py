@@ -0,0 +1,144 @@
+__author__ = 'Konstantin Weddige'
+import unittest
+import random
+
+import numpy
+
+import geometry
+
+try:
+    import miniball
+except ImportError:
+    miniball = None
+else:
+    import geometry.kcenter
+
+
+@unittest.skipUnless(miniball, 'miniball is not installed')
+class TestKCenter(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(0)
+        self.points = [(rng.random() * 10, rng.random() * 10) for i in range(10)]
+
+    def test_gonzalez(self):
+        def reference(k, points):
+            # The list-based version of the algorithm
+            result = [points[0]]
+            data = [(p, geometry.distance(p, result[0])) for p in points[1:]]
+            while len(result) < k:
+                furthest = max(range(len(data)), key=lambda i: data[i][1])
+                new_result = data.pop(furthest)[0]
+                data = [(p, min(dist, geometry.distance(p, new_result))) for p, dist in data]
+                result.append(new_result)
+            return result
+
+        rng = random.Random(1)
+        points = [(rng.random() * 100, rng.random() * 100) for i in range(200)]
+        for k in (1, 2, 5, 20):
+            output, radius = geometry.kcenter.gonzalez(k, points, randomized=False, bound=True)
+            self.assertEqual(output, reference(k, points))
+            self.assertEqual(geometry.kcenter.gonzalez(k, points, randomized=False), output)
+            self.assertAlmostEqual(radius, geometry.kcenter.objective(points, output))
+        # Arrays of points are accepted as well
+        output = geometry.kcenter.gonzalez(3, numpy.array(points), randomized=False)
+        self.assertEqual([tuple(p) for p in output], reference(3, points))
+        self.assertEqual(geometry.kcenter.gonzalez(3, points[:2], bound=True)[1], 0)
+
+    def test_assign(self):
+        centers = self.points[:3]
+        radius, label, radii = geometry.kcenter.assign(self.points, centers)
+        distances = [[geometry.distance(p, c) for c in centers] for p in self.points]
+        self.assertEqual(label.tolist(), [row.index(min(row)) for row in distances])
+        for i in range(len(centers)):
+            self.assertAlmostEqual(radii[i], max(min(row) for row, j in zip(distances, label) if j == i))
+        self.assertAlmostEqual(radius, max(min(row) for row in distances))
+        self.assertAlmostEqual(geometry.kcenter.objective(self.points, centers), radius)
+        self.assertEqual(geometry.kcenter.objective(self.points, []), 0)
+        self.assertEqual(geometry.kcenter.objective([], centers), 0)
+
+    def test_local_search(self):
+        rng = random.Random(2)
+        points = [(rng.random() * 100, rng.random() * 100) for i in range(100)]
+        # A bad start: all centers in one corner
+        centers = sorted(points)[:4]
+        output = geometry.kcenter.local_search(points, centers)
+        self.assertEqual(len(output), 4)
+        self.assertTrue(all(c in points for c in output))
+        self.assertLess(geometry.kcenter.objective(points, output), geometry.kcenter.objective(points, centers))
+        centers = geometry.kcenter.gonzalez(4, points, randomized=False)
+        output = geometry.kcenter.local_search(points, centers)
+        self.assertLessEqual(geometry.kcenter.objective(points, output), geometry.kcenter.objective(points, centers))
+        # Without budget the centers are returned unchanged
+        self.assertEqual(geometry.kcenter.local_search(points, centers, iterations=0), centers)
+        self.assertEqual(geometry.kcenter.local_search(points, centers, timeout=-1), centers)
+
+    def test_brandenberg_roth(self):
+        for k in (1, 2, 3):
+            optimum = geometry.kcenter.objective(self.points, geometry.kcenter.solve(k, self.points))
+            for options in ({'best_first': True}, {'processes': 2}, {'best_first': True, 'processes': 2}):
+                output, statistics = geometry.kcenter.brandenberg_roth(k, self.points, epsilon=0, statistics=True,
+                                                                       **options)
+                self.assertLessEqual(len(output), k)
+                self.assertAlmostEqual(geometry.kcenter.objective(self.points, output), optimum)
+                self.assertLessEqual(statistics['lower_bound'], optimum + 1e-9)
+                self.assertAlmostEqual(statistics['gap'], 0)
+
+    def test_distances(self):
+        k = 3
+        array = numpy.array(self.points)
+        root = geometry.kcenter._State([[] for i in range(k)], numpy.arange(len(array)), [0] * k, [(0, 0)] * k,
+                                       (numpy.hypot(array[:, 0], array[:, 1]), ) * k, [[] for i in range(k)], 0, 0, 0)
+        _, _, _, states = geometry.kcenter._branch_and_bound(k, self.points, 0, [root], frontier=8)
+        self.assertGreaterEqual(len(states), 8)
+        for state in states:
+            # Every state keeps the distances to its own centers
+            for center, distance in zip(state.centers, state.distance):
+                self.assertTrue(numpy.allclose(distance, numpy.hypot(*(array - center).T)))
+            covered = set(numpy.arange(len(array))) - set(state.remainings.tolist())
+            self.assertEqual(sum(len(core) for core in state.core), len(covered))
+
+    def test_enclosing_ball(self):
+        center, radius, support, mb = geometry.kcenter._enclosing_ball([], (0, 0), 0, [], (1, 1))
+        self.assertAlmostEqual(radius, 0)
+        core = [(1, 1)]
+        covered = 0
+        for p in self.points + self.points[:3]:
+            old = center, radius
+            center, radius, support, mb = geometry.kcenter._enclosing_ball(core, center, radius, support, p)
+            core = core + [p]
+            expected = miniball.Miniball(core)
+            self.assertAlmostEqual(radius ** 2, expected.squared_radius())
+            for a, b in zip(center, expected.center()):
+                self.assertAlmostEqual(a, b)
+            # A covered point does not change the ball
+            if mb is None:
+                covered += 1
+                self.assertEqual((center, radius), old)
+            self.assertTrue(all(abs(geometry.distance(q, center) - radius) < 1e-6 for q in support))
+            self.assertTrue(all(geometry.distance(q, center) <= radius + 1e-6 for q in core))
+        self.assertGreaterEqual(covered, 3)
+
+    def test_statistics(self):
+        output, first = geometry.kcenter.brandenberg_roth(2, self.points, epsilon=0, statistics=True)
+        output, second = geometry.kcenter.brandenberg_roth(2, self.points, epsilon=0, statistics=True)
+        # Statistics belong to a single call
+        self.assertEqual(first, second)
+        self.assertGreater(first['nodes'], 0)
+        self.assertGreaterEqual(first['recursions'], first['recursion_depth'])
+        output, parallel = geometry.kcenter.brandenberg_roth(2, self.points, epsilon=0, processes=2, statistics=True)
+        self.assertAlmostEqual(parallel['upper_bound'], first['upper_bound'])
+        self.assertGreater(parallel['nodes'], 0)
+
+    def test_budget(self):
+        for k in (1, 2, 3):
+            optimum = geometry.kcenter.objective(self.points, geometry.kcenter.solve(k, self.points))
+            for options in ({}, {'best_first': True}, {'processes': 2}):
+                output, statistics = geometry.kcenter.brandenberg_roth(k, self.points, epsilon=0, statistics=True,
+                                                                       budget=2, **options)
+                radius = geometry.kcenter.objective(self.points, output)
+                self.assertAlmostEqual(radius, statistics['upper_bound'])
+                self.assertLessEqual(statistics['lower_bound'], optimum + 1e-9)
+                self.assertAlmostEqual(statistics['gap'], radius / statistics['lower_bound'] - 1)
+
+if __name__ == '__main__':
+    unittest.main()
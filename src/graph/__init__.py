@@ -2,9 +2,15 @@ __author__ = 'Konstantin Weddige'
 import itertools
 import math
 import logging
+import heapq
 
 import networkx
-from random import choice, uniform
+import numpy
+import random
+import scipy.spatial
+
+from graph.compact import CompactGraph, all_pairs_distances
+from graph.spatial import SegmentGrid, PointGrid
 
 
 logger = logging.getLogger(__name__)
@@ -39,6 +45,59 @@ def dominating_set(graph, size):
             return nodes
 
 
+def _popcount(mask):
+    return bin(mask).count('1')
+
+
+def bitmask_dominating_set(neighbourhoods, size):
+    """
+    Tries to compute a dominating set of size k with branch and bound.
+
+    The closed neighbourhood of node i is given as integer bitmask neighbourhoods[i], whose bit j is set
+    if i dominates j. The search always branches on the undominated node with the fewest candidates and
+    skips candidates whose new neighbours are a subset of another candidate's new neighbours.
+
+    :param neighbourhoods: list of int
+    :param size: int
+    :return: list of node numbers or None
+    """
+    n = len(neighbourhoods)
+    dominators = [[] for j in range(n)]
+    for i, mask in enumerate(neighbourhoods):
+        j = 0
+        while mask:
+            if mask & 1:
+                dominators[j].append(i)
+            mask >>= 1
+            j += 1
+    largest = max(_popcount(mask) for mask in neighbourhoods) if neighbourhoods else 0
+
+    def search(undominated, size):
+        if not undominated:
+            return []
+        if size == 0 or size * largest < _popcount(undominated):
+            return None
+        target, j, mask = None, 0, undominated
+        while mask:
+            if mask & 1 and (target is None or len(dominators[j]) < len(dominators[target])):
+                target = j
+            mask >>= 1
+            j += 1
+        candidates = sorted(((neighbourhoods[i] & undominated, i) for i in dominators[target]),
+                            key=lambda c: _popcount(c[0]), reverse=True)
+        chosen = list()
+        for gain, i in candidates:
+            if any(gain & other == gain for other in chosen):
+                continue
+            chosen.append(gain)
+            result = search(undominated & ~gain, size - 1)
+            if result is not None:
+                return [i] + result
+        return None
+
+    return search((1 << n) - 1, size)
+
+
 def minimal_dominating_set(graph):
     """
     Computes a minimal dominating set with brute force.
@@ -54,6 +113,71 @@ def minimal_dominating_set(graph):
         k += 1
 
 
+def multi_source_dijkstra(graph, sources, cutoff=None):
+    """
+    Computes the distance of every node to its nearest source in a single Dijkstra pass.
+
+    Nodes are settled in order of increasing distance. If cutoff is set, the search stops as soon as
+    a node beyond cutoff is settled. That node is still part of the result, which allows the caller to
+    detect that the cutoff was exceeded.
+
+    :param graph: Graph
+    :param sources: list of nodes
+    :param cutoff: positive number
+    :return: dict of distances, dict of nearest sources
+    """
+    distance = dict()
+    label = dict()
+    heap = list()
+    counter = itertools.count()
+    for source in sources:
+        heapq.heappush(heap, (0, next(counter), source, source))
+    while heap:
+        dist, _, node, source = heapq.heappop(heap)
+        if node in distance:
+            continue
+        distance[node] = dist
+        label[node] = source
+        if cutoff is not None and dist > cutoff:
+            break
+        for neighbour, data in graph[node].items():
+            if neighbour not in distance:
+                heapq.heappush(heap, (dist + data.get('weight', 1), next(counter), neighbour, source))
+    return distance, label
+
+
+def update_distances(graph, source, distance, label=None):
+    """
+    Adds source to the centers of a multi-source Dijkstra result.
+
+    Only nodes that get closer to the new source are visited. The search is pruned at every node
+    whose distance does not improve, as no shortest path from the new source through that node can
+    improve either. distance and label are updated in place.
+
+    :param graph: Graph
+    :param source: node
+    :param distance: dict of distances
+    :param label: dict of nearest sources
+    :return: list of updated nodes
+    """
+    updated = list()
+    heap = [(0, 0, source)]
+    counter = itertools.count(1)
+    while heap:
+        dist, _, node = heapq.heappop(heap)
+        if dist >= distance.get(node, float('inf')):
+            continue
+        distance[node] = dist
+        if label is not None:
+            label[node] = source
+        updated.append(node)
+        for neighbour, data in graph[node].items():
+            new_dist = dist + data.get('weight', 1)
+            if new_dist < distance.get(neighbour, float('inf')):
+                heapq.heappush(heap, (new_dist, next(counter), neighbour))
+    return updated
+
+
 def _ccw(a, b, c):
     """
     counterclockwise
@@ -80,19 +204,23 @@ def _ccw(a, b, c):
             return 1
 
 
-def edge_crossings(graph, x=None, y=None):
+def edge_crossings(graph, x=None, y=None, index=None):
     """
     Returns if there are edge crossings in graph.
 
+    If index is given, only the edges found by the spatial index are tested.
+    See graph.spatial.SegmentGrid.
+
     :param graph: Graph
     :param x: edge
     :param y: edge
+    :param index: SegmentGrid
     :return: bool
     """
     if not (x is None or y is None):
         a = graph.node[x]['pos']
         b = graph.node[y]['pos']
-        for edge in graph.edges():
+        for edge in (graph.edges() if index is None else index.query(a, b)):
             if edge[0] == x or edge[1] == x or edge[0] == y or edge[1] == y:
                 continue
             c = graph.node[edge[0]]['pos']
@@ -101,42 +229,87 @@ def edge_crossings(graph, x=None, y=None):
                 return True
     else:
         for edge in graph.edges():
-            if edge_crossings(graph, x=edge[0], y=edge[1]):
+            if edge_crossings(graph, x=edge[0], y=edge[1], index=index):
                 return True
     return False
 
 
-def erdos_renyi_random_planar_graph(n, p=0.5, radius=2/3):
+def erdos_renyi_random_planar_graph(n, p=0.5, radius=2/3, seed=None):
     """
     Returns a random planar graph.
 
+    Positions and coin flips are drawn with numpy. Only the pairs closer than radius whose coin flip
+    succeeded are tested for crossings, in the same order as before. The pairs are generated node by
+    node, so they never have to be held in memory at once.
+
     :param n: int
     :param p: [0,1]
     :param radius: [0,1]
+    :param seed: seed for the random number generator
     :return: Graph
     """
     size = 100
+    generator = numpy.random.RandomState(seed)
+    positions = generator.uniform(0, size, (n, 2))
     graph = networkx.Graph()
+    # Candidates are up to size * radius long, but most of them are stopped by an edge close to x
+    index = SegmentGrid(size * radius / 64)
     for node in range(n):
-        graph.add_node(node, pos=(uniform(0, size), uniform(0, size)))
-    for edge in itertools.combinations(graph.nodes(data=True), 2):
-        weight = math.sqrt((edge[0][1]['pos'][0] - edge[1][1]['pos'][0])**2 +
-                           (edge[0][1]['pos'][1] - edge[1][1]['pos'][1])**2)
-        if uniform(0, 1) < p and weight < size * radius:
-            if not edge_crossings(graph, edge[0][0], edge[1][0]):
-                graph.add_edge(edge[0][0], edge[1][0], weight=weight)
+        graph.add_node(node, pos=tuple(positions[node]))
+    tree = scipy.spatial.cKDTree(positions)
+    for x in range(n):
+        neighbours = numpy.array(tree.query_ball_point(positions[x], size * radius), dtype=int)
+        neighbours = numpy.sort(neighbours[neighbours > x])
+        weights = numpy.hypot(*(positions[neighbours] - positions[x]).T)
+        neighbours = neighbours[(generator.uniform(0, 1, len(neighbours)) < p) & (weights < size * radius)]
+        for y in neighbours.tolist():
+            if not edge_crossings(graph, x, y, index=index):
+                a, b = graph.node[x]['pos'], graph.node[y]['pos']
+                graph.add_edge(x, y, weight=math.sqrt((a[0] - b[0])**2 + (a[1] - b[1])**2))
+                index.add(x, y, a, b)
     return graph
 
 
-def get_nodes_within(graph, x, r):
+def delaunay_random_planar_graph(n, p=0.5, radius=2/3, seed=None):
+    """
+    Returns a random planar graph for large benchmark instances.
+
+    The candidate edges are taken from the Delaunay triangulation of n random points, which is planar.
+    Every candidate shorter than radius is kept with probability p. All steps are vectorized, so this
+    scales to millions of nodes. The result is built directly as CompactGraph with positions
+    and can be written with CompactGraph.save.
+
+    :param n: int
+    :param p: [0,1]
+    :param radius: [0,1]
+    :param seed: seed for the random number generator
+    :return: CompactGraph
+    """
+    size = 100
+    generator = numpy.random.RandomState(seed)
+    positions = generator.uniform(0, size, (n, 2))
+    simplices = scipy.spatial.Delaunay(positions).simplices
+    pairs = numpy.concatenate([simplices[:, [0, 1]], simplices[:, [1, 2]], simplices[:, [0, 2]]])
+    pairs = numpy.unique(numpy.sort(pairs, axis=1), axis=0)
+    weights = numpy.hypot(*(positions[pairs[:, 0]] - positions[pairs[:, 1]]).T)
+    keep = (generator.uniform(0, 1, len(pairs)) < p) & (weights < size * radius)
+    return CompactGraph.from_edges(range(n), pairs[keep, 0], pairs[keep, 1], weights[keep], positions)
+
+
+def get_nodes_within(graph, x, r, index=None):
     """
     Returns nodes within radius r of x.
 
+    If index is given, it is used instead of scanning all nodes. See graph.spatial.PointGrid.
+
     :param graph: Graph
     :param x: node
     :param r: positive number
+    :param index: PointGrid
     :return: list of nodes
     """
+    if index is not None:
+        return [y for y in index.query(graph.node[x]['pos'], r) if not x == y]
     result = list()
     for y in graph.nodes():
         if not x == y:
@@ -147,7 +320,7 @@ def get_nodes_within(graph, x, r):
     return result
 
 
-def growing_random_planar_graph(n, m=5, f=lambda: uniform(2, 5)):
+def growing_random_planar_graph(n, m=5, f=None, seed=None):
     """
     See Random planar graphs and the London street network
     by A.P. Masuccia, D. Smith, A. Crooks, and M. Batty
@@ -155,23 +328,37 @@ def growing_random_planar_graph(n, m=5, f=lambda: uniform(2, 5)):
 
     :param n: int
     :param m: int
+    :param f: function that returns edge lengths, defaults to uniform(2, 5)
+    :param seed: seed for the random number generator
     :return: Graph
     """
+    generator = random.Random(seed)
+    if f is None:
+        f = lambda: generator.uniform(2, 5)
     result = networkx.Graph()
     result.add_node(0, pos=(0, 0))
+    # networkx neither offers random access to the nodes nor counts the edges in constant time
+    nodes = [(0, result.node[0])]
+    edges = 0
+    index = SegmentGrid(5)
+    points = PointGrid(5)
+    points.add(0, (0, 0))
     tries = 0
     tries_bound = m #  Choose good bound tor tries
-    while result.number_of_nodes() < n:
-        x, data = choice(result.nodes(data=True))
+    while len(nodes) < n:
+        x, data = generator.choice(nodes)
         r = f()
-        if (result.number_of_edges() + 1) % m == 0 and tries < tries_bound:
-            neighbourhood = get_nodes_within(result, x, r)
+        if (edges + 1) % m == 0 and tries < tries_bound:
+            neighbourhood = get_nodes_within(result, x, r, index=points)
             if neighbourhood:
-                y = choice(neighbourhood)
-                if not edge_crossings(result, x=x, y=y):
+                y = generator.choice(neighbourhood)
+                if not edge_crossings(result, x=x, y=y, index=index):
                     weight = math.sqrt((data['pos'][0] - result.node[y]['pos'][0])**2 +
                                        (data['pos'][1] - result.node[y]['pos'][1])**2)
+                    if not result.has_edge(x, y):
+                        edges += 1
                     result.add_edge(x, y, weight=weight)
+                    index.add(x, y, data['pos'], result.node[y]['pos'])
                     tries = 0
                 else:
                     tries += 1
@@ -180,30 +367,46 @@ def growing_random_planar_graph(n, m=5, f=lambda: uniform(2, 5)):
         else:
             if tries:
                 tries = 0
-            phi = uniform(0, 2 * math.pi)
+            phi = generator.uniform(0, 2 * math.pi)
             pos = (data['pos'][0] + r * math.sin(phi), data['pos'][1] + r * math.cos(phi))
-            y = result.number_of_nodes()
+            y = len(nodes)
             result.add_node(y, pos=pos)
-            if not edge_crossings(result, x=x, y=y):
+            if not edge_crossings(result, x=x, y=y, index=index):
                 result.add_edge(x, y, weight=r)
+                edges += 1
+                index.add(x, y, data['pos'], pos)
+                points.add(y, pos)
+                nodes.append((y, result.node[y]))
             else:
                 result.remove_node(y)
     return result
 
 
-def build_grid(n, m, l=1):
+def build_grid(n, m, l=1, seed=None):
     """
     See Random planar graphs and the London street network
     by A.P. Masuccia, D. Smith, A. Crooks, and M. Batty
     for further information.
+
+    :param n: int
+    :param m: int
+    :param l: positive number
+    :param seed: seed for the random number generator
+    :return: Graph
     """
+    generator = random.Random(seed)
     result = networkx.grid_2d_graph(n, n)
     for a in result.nodes():
         result.node[a]['pos'] = (l * a[0], l * a[1])
-    for e in result.edges():
+    edges = result.edges()
+    for e in edges:
         result.edge[e[0]][e[1]]['weight'] = l
     for i in range(m):
-        e = choice(result.edges())
+        # Remove the chosen edge from the list by swapping it with the last one
+        j = generator.randrange(len(edges))
+        e = edges[j]
+        edges[j] = edges[-1]
+        edges.pop()
         sigma = result.edge[e[0]][e[1]]['weight']
         apos = (
             (result.node[e[0]]['pos'][0] + result.node[e[1]]['pos'][0]) / 2,
@@ -220,21 +423,26 @@ def build_grid(n, m, l=1):
         result.add_edge(e[0], a, weight=sigma / 2)
         result.add_edge(e[1], a, weight=sigma / 2)
         result.remove_edge(e[0], e[1])
+        edges.extend([(a, a + 1), (e[0], a), (e[1], a)])
     return result
 
-def add_missing_edges(graph):
+
+def add_missing_edges(graph, processes=1):
     """
-    Returns a complete graph.
+    Returns a complete graph. The missing edges get the length of the shortest path as weight.
+    All distances are computed in a single all-pairs pass, see graph.compact.all_pairs_distances.
+    A process pool only pays off for large graphs, so it is not used by default.
 
     :param graph: Graph
+    :param processes: int, None uses all CPUs
     :return: Graph
     """
     result = graph.copy()
-    for edge in itertools.combinations(result.nodes(), 2):
-        if not result.has_edge(*edge):
-            try:
-                weight = networkx.shortest_path_length(result, *edge, weight='weight')
-                result.add_edge(*edge, weight=weight)
-            except networkx.NetworkXNoPath:
-                pass
-    return result
\ No newline at end of file
+    nodes = result.nodes()
+    compact_graph = CompactGraph.from_networkx(result)
+    distance = all_pairs_distances(compact_graph, processes)
+    missing = numpy.isfinite(distance)
+    missing[compact_graph.edges()[:2]] = False
+    for i, j in zip(*numpy.nonzero(numpy.triu(missing, 1))):
+        result.add_edge(nodes[i], nodes[j], weight=float(distance[i, j]))
+    return result
@@ -0,0 +1,343 @@
+"""
+Compact array representation of weighted graphs
+"""
+__author__ = 'Konstantin Weddige'
+import os
+import hashlib
+import multiprocessing
+import numpy
+import scipy.sparse
+import scipy.sparse.csgraph
+
+
+class CompactGraph:
+    """A frozen, array-backed version of an undirected weighted graph.
+
+    Nodes are numbered from 0 to n - 1. The original node labels are kept in labels and index maps
+    them back to their numbers. Like a networkx graph, nodes() returns the list of node labels.
+    The edges are stored in compressed sparse row format: the neighbours of node i are
+    indices[indptr[i]:indptr[i + 1]] and the corresponding edge weights are weights[indptr[i]:indptr[i + 1]].
+    Every undirected edge is stored in both directions. Node positions are optional and kept as
+    (n, 2) array in positions.
+    """
+    __slots__ = ('labels', 'index', 'indptr', 'indices', 'weights', 'positions', '_matrix', '__weakref__')
+
+    def __init__(self, nodes, indptr, indices, weights, positions=None):
+        """
+        :param nodes: list of node labels
+        :param indptr: array of n + 1 offsets
+        :param indices: array of targets
+        :param weights: array of weights
+        :param positions: array of shape (n, 2)
+        """
+        indptr = numpy.array(indptr, dtype=numpy.int64)
+        indices = numpy.array(indices, dtype=numpy.int32)
+        weights = numpy.array(weights, dtype=numpy.float64)
+        if positions is not None:
+            positions = numpy.array(positions, dtype=numpy.float64)
+        for array in (indptr, indices, weights, positions):
+            if array is not None:
+                array.flags.writeable = False
+        object.__setattr__(self, 'labels', list(nodes))
+        object.__setattr__(self, 'index', {node: i for i, node in enumerate(self.labels)})
+        object.__setattr__(self, 'indptr', indptr)
+        object.__setattr__(self, 'indices', indices)
+        object.__setattr__(self, 'weights', weights)
+        object.__setattr__(self, 'positions', positions)
+        object.__setattr__(self, '_matrix', None)
+
+    def __setattr__(self, key, value):
+        raise AttributeError('CompactGraph is immutable')
+
+    def __reduce__(self):
+        return self.__class__, (self.labels, self.indptr, self.indices, self.weights, self.positions)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __contains__(self, node):
+        return node in self.index
+
+    @classmethod
+    def from_edges(cls, nodes, sources, targets, weights, positions=None):
+        """Builds a compact graph from arrays of undirected edges.
+
+        :param nodes: list of node labels
+        :param sources: array of node numbers
+        :param targets: array of node numbers
+        :param weights: array of weights
+        :param positions: array of shape (n, 2)
+        :return: CompactGraph
+        """
+        sources = numpy.asarray(sources, dtype=numpy.int64)
+        targets = numpy.asarray(targets, dtype=numpy.int64)
+        weights = numpy.asarray(weights, dtype=numpy.float64)
+        loops = sources == targets
+        sources, targets, weights = sources[~loops], targets[~loops], weights[~loops]
+        rows = numpy.concatenate([sources, targets])
+        columns = numpy.concatenate([targets, sources])
+        values = numpy.concatenate([weights, weights])
+        order = numpy.lexsort((columns, rows))
+        indptr = numpy.zeros(len(nodes) + 1, dtype=numpy.int64)
+        numpy.cumsum(numpy.bincount(rows, minlength=len(nodes)), out=indptr[1:])
+        return cls(nodes, indptr, columns[order], values[order], positions)
+
+    @classmethod
+    def from_networkx(cls, graph, weight='weight'):
+        """Builds a compact graph from a networkx graph. If all nodes have a pos attribute, the positions
+        are kept.
+
+        :param graph: Graph
+        :param weight: name of the weight attribute
+        :return: CompactGraph
+        """
+        nodes = graph.nodes()
+        index = {node: i for i, node in enumerate(nodes)}
+        edges = graph.edges(data=True)
+        sources = numpy.fromiter((index[e[0]] for e in edges), dtype=numpy.int64, count=len(edges))
+        targets = numpy.fromiter((index[e[1]] for e in edges), dtype=numpy.int64, count=len(edges))
+        weights = numpy.fromiter((e[2].get(weight, 1) for e in edges), dtype=numpy.float64, count=len(edges))
+        positions = None
+        if nodes and all('pos' in data for data in graph.node.values()):
+            positions = [graph.node[node]['pos'] for node in nodes]
+        return cls.from_edges(nodes, sources, targets, weights, positions)
+
+    @classmethod
+    def load(cls, filename):
+        """Reads a compact graph written by save.
+
+        :param filename: str
+        :return: CompactGraph
+        """
+        with numpy.load(filename, allow_pickle=True) as data:
+            positions = data['positions'] if 'positions' in data else None
+            return cls(data['labels'].tolist(), data['indptr'], data['indices'], data['weights'], positions)
+
+    def save(self, filename):
+        """Writes the graph to a .npz file.
+
+        :param filename: str
+        """
+        labels = numpy.empty(len(self.labels), dtype=object)
+        labels[:] = self.labels
+        arrays = {'labels': labels, 'indptr': self.indptr, 'indices': self.indices, 'weights': self.weights}
+        if self.positions is not None:
+            arrays['positions'] = self.positions
+        numpy.savez(filename, **arrays)
+
+    def nodes(self):
+        return list(self.labels)
+
+    def number_of_nodes(self):
+        return len(self.labels)
+
+    def number_of_edges(self):
+        return len(self.indices) // 2
+
+    def neighbors(self, i):
+        """Returns the numbers and edge weights of the neighbours of node number i.
+
+        :param i: int
+        :return: array of node numbers, array of weights
+        """
+        return self.indices[self.indptr[i]:self.indptr[i + 1]], self.weights[self.indptr[i]:self.indptr[i + 1]]
+
+    def edges(self):
+        """Returns every undirected edge once.
+
+        :return: array of sources, array of targets, array of weights
+        """
+        sources = numpy.repeat(numpy.arange(len(self.labels)), numpy.diff(self.indptr))
+        upper = sources < self.indices
+        return sources[upper], self.indices[upper], self.weights[upper]
+
+    def fingerprint(self):
+        """Returns a hash of the node labels, the edges and the weights. It is used to check whether a
+        file written for a graph belongs to this graph.
+
+        :return: str
+        """
+        result = hashlib.sha1(repr(self.labels).encode())
+        for array in (self.indptr, self.indices, self.weights):
+            result.update(array.tobytes())
+        return result.hexdigest()
+
+    def numbers(self, nodes):
+        """Maps node labels to node numbers.
+
+        :param nodes: list of nodes
+        :return: array of int
+        """
+        return numpy.fromiter((self.index[node] for node in nodes), dtype=numpy.int64, count=len(nodes))
+
+    @property
+    def matrix(self):
+        """The adjacency matrix as scipy.sparse.csr_matrix.
+
+        :return: csr_matrix
+        """
+        if self._matrix is None:
+            matrix = scipy.sparse.csr_matrix((self.weights, self.indices, self.indptr),
+                                             shape=(len(self.labels), len(self.labels)))
+            object.__setattr__(self, '_matrix', matrix)
+        return self._matrix
+
+
+def compact(graph):
+    """Returns graph as CompactGraph. Compact graphs are returned unchanged.
+
+    :param graph: Graph or CompactGraph
+    :return: CompactGraph
+    """
+    if isinstance(graph, CompactGraph):
+        return graph
+    return CompactGraph.from_networkx(graph)
+
+
+def dijkstra(graph, sources, limit=numpy.inf, min_only=False):
+    """Runs Dijkstra's algorithm on a compact graph.
+
+    If min_only is set, a single multi-source run is done and the distance to and the number of the
+    nearest source are returned for every node. Otherwise a matrix with one row per source is returned.
+    Nodes further away than limit get an infinite distance.
+
+    :param graph: CompactGraph
+    :param sources: array of node numbers
+    :param limit: float
+    :param min_only: bool
+    :return: array of distances (and array of sources)
+    """
+    if min_only:
+        distance, _, nearest = scipy.sparse.csgraph.dijkstra(graph.matrix, directed=True, indices=sources,
+                                                             limit=limit, min_only=True,
+                                                             return_predecessors=True)
+        return distance, nearest
+    return scipy.sparse.csgraph.dijkstra(graph.matrix, directed=True, indices=sources, limit=limit)
+
+
+def distance_matrix(graph, rows, columns, dtype=numpy.float64, filename=None, chunk_size=None):
+    """Computes the distances between the nodes in rows and the nodes in columns.
+
+    Only the requested part of the matrix is computed, with one Dijkstra run for every node of the
+    smaller of both sets. The runs are done in chunks, so only chunk_size rows of length n have to be
+    kept in memory at once. If filename is set, the matrix is written to a memory-mapped .npy file and
+    a hash of graph, rows, columns and dtype to filename + '.key'. If both files already exist and the
+    hash matches, the matrix is reused instead. The files are only created after the matrix is complete,
+    so an interrupted computation is never reused.
+
+    :param graph: CompactGraph
+    :param rows: list of nodes
+    :param columns: list of nodes
+    :param dtype: numpy data type
+    :param filename: str
+    :param chunk_size: int
+    :return: array or memmap
+    """
+    shape = (len(rows), len(columns))
+    rows, columns = graph.numbers(rows), graph.numbers(columns)
+    if filename:
+        key = hashlib.sha1(graph.fingerprint().encode())
+        for array in (rows, columns):
+            key.update(array.tobytes())
+        key.update(numpy.dtype(dtype).str.encode())
+        key = key.hexdigest()
+        if os.path.exists(filename) and os.path.exists(filename + '.key'):
+            with open(filename + '.key') as file:
+                if file.read() == key:
+                    return numpy.load(filename, mmap_mode='r')
+        temporary = filename + '.tmp'
+        matrix = numpy.lib.format.open_memmap(temporary, mode='w+', dtype=dtype, shape=shape)
+    else:
+        matrix = numpy.empty(shape, dtype=dtype)
+    transposed = len(columns) < len(rows)
+    sources, targets = (columns, rows) if transposed else (rows, columns)
+    if not chunk_size:
+        # Keep about 128 MB of intermediate results
+        chunk_size = max(1, 2 ** 24 // max(1, len(graph)))
+    for start in range(0, len(sources), chunk_size):
+        distance = dijkstra(graph, sources[start:start + chunk_size])[:, targets]
+        if transposed:
+            matrix[:, start:start + chunk_size] = distance.T
+        else:
+            matrix[start:start + chunk_size] = distance
+    if filename:
+        matrix.flush()
+        del matrix
+        # Invalidate the old key before the matrix is replaced
+        if os.path.exists(filename + '.key'):
+            os.remove(filename + '.key')
+        os.replace(temporary, filename)
+        with open(filename + '.key.tmp', 'w') as file:
+            file.write(key)
+        os.replace(filename + '.key.tmp', filename + '.key')
+        matrix = numpy.load(filename, mmap_mode='r')
+    return matrix
+
+
+def all_pairs_distances(graph, processes=None):
+    """Computes the distances between all nodes in a single pass.
+
+    The sources are split into chunks and every chunk is solved with one Dijkstra run per source on a
+    process pool.
+
+    :param graph: CompactGraph
+    :param processes: int, defaults to the number of CPUs. With 1 no pool is used.
+    :return: array
+    """
+    sources = numpy.arange(len(graph))
+    if processes == 1:
+        return dijkstra(graph, sources)
+    processes = processes or multiprocessing.cpu_count()
+    chunks = numpy.array_split(sources, 4 * processes)
+    with multiprocessing.Pool(processes) as pool:
+        rows = pool.starmap(dijkstra, [(graph, chunk) for chunk in chunks if len(chunk)])
+    return numpy.concatenate(rows)
+
+
+def metric_closure(graph, processes=None):
+    """Computes the complete graph whose edge weights are the shortest path distances.
+    Pairs of nodes that are not connected get no edge.
+
+    :param graph: CompactGraph
+    :param processes: int
+    :return: CompactGraph
+    """
+    distance = all_pairs_distances(graph, processes)
+    sources, targets = numpy.nonzero(numpy.triu(numpy.isfinite(distance), 1))
+    return CompactGraph.from_edges(graph.labels, sources, targets, distance[sources, targets])
+
+
+def squared_threshold_graph(graph, threshold):
+    """Computes the square of the graph that contains all edges with weight up to threshold.
+    Only the sparsity pattern is computed: two nodes are adjacent if they are connected
+    by a path of at most two such edges.
+
+    :param graph: CompactGraph
+    :param threshold: float
+    :return: boolean csr_matrix
+    """
+    adjacency = scipy.sparse.csr_matrix((graph.weights <= threshold, graph.indices, graph.indptr),
+                                        shape=(len(graph), len(graph)), dtype=bool, copy=True)
+    adjacency.eliminate_zeros()
+    squared = (adjacency + adjacency @ adjacency).tocsr()
+    squared.eliminate_zeros()
+    return squared
+
+
+def maximal_independent_set(matrix, limit=None):
+    """Computes a maximal independent set greedily in node order.
+
+    :param matrix: csr_matrix
+    :param limit: int, stop as soon as the set grows beyond limit
+    :return: list of node numbers or None if limit was exceeded
+    """
+    covered = numpy.zeros(matrix.shape[0], dtype=bool)
+    result = list()
+    for i in range(matrix.shape[0]):
+        if not covered[i]:
+            if limit is not None and len(result) >= limit:
+                return None
+            result.append(i)
+            covered[i] = True
+            covered[matrix.indices[matrix.indptr[i]:matrix.indptr[i + 1]]] = True
+    return result
@@ -0,0 +1,143 @@
+"""
+k-center labels that follow changes of edge weights
+"""
+__author__ = 'Konstantin Weddige'
+import collections
+import heapq
+import itertools
+
+
+class DynamicKCenter:
+    """Holds the centers of a k-center solution together with the distance of every node to its
+    nearest center, the center itself and the parent in the shortest path forest.
+
+    After a batch of edge updates only the affected labels are repaired. A decreased edge starts a
+    pruned Dijkstra search from its endpoints. An increased or removed edge of the forest invalidates
+    the subtree below it, which is then searched again from its border. So a small change costs time
+    proportional to the region whose labels actually change.
+    """
+
+    def __init__(self, graph, centers):
+        """
+        :param graph: Graph, is changed by update
+        :param centers: list of nodes, e.g. the result of gonzalez
+        """
+        self.graph = graph
+        self.centers = list(centers)
+        self.distance = dict()
+        self.label = dict()
+        self.parent = dict()
+        self._children = collections.defaultdict(set)
+        # Max heap of (-distance, counter, node) with outdated entries
+        self._heap = list()
+        self._counter = itertools.count()
+        self._search([(0, center, None, center) for center in self.centers])
+
+    def _search(self, entries):
+        """Runs a Dijkstra search that only settles nodes whose distance improves.
+
+        :param entries: list of (distance, node, parent, center)
+        :return: list of updated nodes
+        """
+        heap = [(dist, next(self._counter), node, parent, center) for dist, node, parent, center in entries]
+        heapq.heapify(heap)
+        updated = list()
+        while heap:
+            dist, _, node, parent, center = heapq.heappop(heap)
+            if dist >= self.distance.get(node, float('inf')):
+                continue
+            if node in self.parent:
+                self._children[self.parent[node]].discard(node)
+            if parent is not None:
+                self._children[parent].add(node)
+            self.distance[node] = dist
+            self.label[node] = center
+            self.parent[node] = parent
+            heapq.heappush(self._heap, (-dist, next(self._counter), node))
+            updated.append(node)
+            for neighbour, data in self.graph[node].items():
+                new_dist = dist + data.get('weight', 1)
+                if new_dist < self.distance.get(neighbour, float('inf')):
+                    heapq.heappush(heap, (new_dist, next(self._counter), neighbour, node, center))
+        return updated
+
+    def update(self, changes):
+        """Applies a batch of edge updates to the graph and repairs the labels. Missing edges are
+        added. A weight of None removes the edge.
+
+        :param changes: list of (node, node, weight)
+        :return: list of nodes whose labels changed
+        """
+        # The weight of every changed edge before the batch, so repeated changes of an edge are merged
+        original = dict()
+        for u, v, weight in changes:
+            key = frozenset((u, v))
+            if key not in original:
+                original[key] = (u, v, self.weight(u, v))
+            if weight is None:
+                if self.graph.has_edge(u, v):
+                    self.graph.remove_edge(u, v)
+            else:
+                self.graph.add_edge(u, v, weight=weight)
+        invalid = list()
+        decreased = list()
+        for u, v, old in original.values():
+            weight = self.weight(u, v)
+            if weight < old:
+                decreased.append((u, v, weight))
+            elif weight > old:
+                # Only edges of the shortest path forest matter
+                invalid.extend(b for a, b in ((u, v), (v, u)) if self.parent.get(b) == a)
+        # Invalidate the subtrees below increased edges
+        invalid = set(invalid)
+        stack = list(invalid)
+        while stack:
+            for child in self._children.pop(stack.pop(), ()):
+                if child not in invalid:
+                    invalid.add(child)
+                    stack.append(child)
+        for node in invalid:
+            self._children[self.parent.pop(node)].discard(node)
+            del self.distance[node]
+            del self.label[node]
+        # Seed the search from the border of the invalid region and the decreased edges
+        entries = list()
+        for node in invalid:
+            for neighbour, data in self.graph[node].items():
+                if neighbour in self.distance:
+                    entries.append((self.distance[neighbour] + data.get('weight', 1), node, neighbour,
+                                    self.label[neighbour]))
+        for u, v, weight in decreased:
+            for a, b in ((u, v), (v, u)):
+                if a in self.distance:
+                    entries.append((self.distance[a] + weight, b, a, self.label[a]))
+        updated = set(self._search(entries))
+        if len(self._heap) > 2 * len(self.distance) + 64:
+            self._heap = [(-dist, next(self._counter), node) for node, dist in self.distance.items()]
+            heapq.heapify(self._heap)
+        return list(invalid | updated)
+
+    def weight(self, u, v):
+        """Returns the weight of the edge (u, v), or infinity if there is no such edge.
+
+        :param u: node
+        :param v: node
+        :return: float
+        """
+        return self.graph[u][v].get('weight', 1) if self.graph.has_edge(u, v) else float('inf')
+
+    @property
+    def radius(self):
+        """The distance of the farthest node to its nearest center. It is infinite if some node
+        cannot reach any center.
+
+        :return: float
+        """
+        if len(self.distance) < self.graph.number_of_nodes():
+            return float('inf')
+        while self._heap:
+            dist, _, node = self._heap[0]
+            if self.distance.get(node) == -dist:
+                return -dist
+            heapq.heappop(self._heap)
+        return 0
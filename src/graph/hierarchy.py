@@ -0,0 +1,291 @@
+"""
+Contraction hierarchies for fast distance queries on static road networks
+"""
+__author__ = 'Konstantin Weddige'
+import os
+import heapq
+import itertools
+import logging
+import numpy
+
+from graph.compact import compact
+
+logger = logging.getLogger(__name__)
+
+
+class ContractionHierarchy:
+    """A contraction hierarchy of an undirected weighted graph.
+    See "Contraction Hierarchies: Faster and Simpler Hierarchical Routing in Road Networks"
+    by Robert Geisberger, Peter Sanders, Dominik Schultes and Daniel Delling for more details.
+
+    Nodes are contracted one after another. Whenever the shortest path between two neighbours of a
+    contracted node leads over that node, a shortcut is added. Every node keeps the edges (original
+    edges and shortcuts) to nodes of higher rank in compressed sparse row format. middle holds the
+    contracted node of a shortcut or -1 for original edges. A query only needs to search upwards
+    from both ends.
+    """
+
+    def __init__(self, labels, rank, indptr, indices, weights, middle, fingerprint=None):
+        """
+        :param labels: list of node labels
+        :param rank: array of contraction ranks
+        :param indptr: array of n + 1 offsets
+        :param indices: array of higher ranked neighbours
+        :param weights: array of weights
+        :param middle: array of contracted nodes
+        :param fingerprint: str, see CompactGraph.fingerprint
+        """
+        self.labels = list(labels)
+        self.fingerprint = fingerprint
+        self.index = {node: i for i, node in enumerate(self.labels)}
+        self.rank = numpy.asarray(rank, dtype=numpy.int64)
+        self.indptr = numpy.asarray(indptr, dtype=numpy.int64)
+        self.indices = numpy.asarray(indices, dtype=numpy.int64)
+        self.weights = numpy.asarray(weights, dtype=numpy.float64)
+        self.middle = numpy.asarray(middle, dtype=numpy.int64)
+        self._up = [list(zip(self.indices[self.indptr[i]:self.indptr[i + 1]].tolist(),
+                             self.weights[self.indptr[i]:self.indptr[i + 1]].tolist()))
+                    for i in range(len(self.labels))]
+        self._middle = None
+
+    def __len__(self):
+        return len(self.labels)
+
+    @classmethod
+    def build(cls, graph, settle_limit=50):
+        """Contracts all nodes of graph. The order is chosen by the edge difference, i.e. the number of
+        shortcuts minus the number of removed edges, plus the depth of the contracted neighbourhood.
+
+        :param graph: Graph or CompactGraph
+        :param settle_limit: int, nodes settled by a witness search at most. Smaller values give faster
+            preprocessing but more shortcuts.
+        :return: ContractionHierarchy
+        """
+        graph = compact(graph)
+        n = len(graph)
+        # Remaining graph: neighbours[v][u] = (weight, middle)
+        neighbours = [dict() for i in range(n)]
+        for u, v, weight in zip(*(array.tolist() for array in graph.edges())):
+            if weight < neighbours[u].get(v, (float('inf'), ))[0]:
+                neighbours[u][v] = (weight, -1)
+                neighbours[v][u] = (weight, -1)
+        depth = [0] * n
+        rank = numpy.zeros(n, dtype=numpy.int64)
+        contracted = [False] * n
+        up = [None] * n
+
+        def witness_search(source, excluded, limit):
+            distance = {source: 0}
+            heap = [(0, source)]
+            settled = 0
+            while heap and settled < settle_limit:
+                dist, node = heapq.heappop(heap)
+                if dist > distance[node]:
+                    continue
+                if dist > limit:
+                    break
+                settled += 1
+                for neighbour, (weight, _) in neighbours[node].items():
+                    if neighbour == excluded:
+                        continue
+                    if dist + weight < distance.get(neighbour, float('inf')):
+                        distance[neighbour] = dist + weight
+                        heapq.heappush(heap, (dist + weight, neighbour))
+            return distance
+
+        def shortcuts(v):
+            result = list()
+            items = list(neighbours[v].items())
+            for i, (u, (weight_u, _)) in enumerate(items):
+                others = items[i + 1:]
+                if not others:
+                    continue
+                limit = weight_u + max(weight_w for _, (weight_w, _) in others)
+                distance = witness_search(u, v, limit)
+                for w, (weight_w, _) in others:
+                    if distance.get(w, float('inf')) > weight_u + weight_w:
+                        result.append((u, w, weight_u + weight_w))
+            return result
+
+        def priority(v):
+            return len(shortcuts(v)) - len(neighbours[v]) + depth[v]
+
+        heap = [(priority(v), v) for v in range(n)]
+        heapq.heapify(heap)
+        for r in itertools.count():
+            # Lazy updates: recompute the priority and contract only if it is still minimal
+            while heap:
+                _, v = heapq.heappop(heap)
+                if contracted[v]:
+                    continue
+                current = priority(v)
+                if heap and current > heap[0][0]:
+                    heapq.heappush(heap, (current, v))
+                else:
+                    break
+            else:
+                break
+            new_edges = shortcuts(v)
+            up[v] = list(neighbours[v].items())
+            for u in neighbours[v]:
+                del neighbours[u][v]
+                depth[u] = max(depth[u], depth[v] + 1)
+            neighbours[v] = dict()
+            for u, w, weight in new_edges:
+                if weight < neighbours[u].get(w, (float('inf'), ))[0]:
+                    neighbours[u][w] = (weight, v)
+                    neighbours[w][u] = (weight, v)
+            contracted[v] = True
+            rank[v] = r
+        indptr = numpy.zeros(n + 1, dtype=numpy.int64)
+        numpy.cumsum([len(edges) for edges in up], out=indptr[1:])
+        edges = [(u, weight, middle) for v in range(n) for u, (weight, middle) in up[v]]
+        indices, weights, middle = zip(*edges) if edges else ((), (), ())
+        logger.info('Contracted {0} nodes with {1} edges'.format(n, len(edges)))
+        return cls(graph.labels, rank, indptr, indices, weights, middle, graph.fingerprint())
+
+    @classmethod
+    def load(cls, filename):
+        """Reads a hierarchy written by save.
+
+        :param filename: str
+        :return: ContractionHierarchy
+        """
+        with numpy.load(filename, allow_pickle=True) as data:
+            fingerprint = str(data['fingerprint']) if 'fingerprint' in data else None
+            return cls(data['labels'].tolist(), data['rank'], data['indptr'], data['indices'], data['weights'],
+                       data['middle'], fingerprint)
+
+    def save(self, filename):
+        """Writes the hierarchy to a .npz file. The file is written to a temporary file first, so an
+        interrupted write never leaves a broken hierarchy behind.
+
+        :param filename: str
+        """
+        labels = numpy.empty(len(self.labels), dtype=object)
+        labels[:] = self.labels
+        arrays = {'labels': labels, 'rank': self.rank, 'indptr': self.indptr, 'indices': self.indices,
+                  'weights': self.weights, 'middle': self.middle}
+        if self.fingerprint is not None:
+            arrays['fingerprint'] = self.fingerprint
+        # numpy.savez only appends .npz if it gets a name instead of a file
+        with open(filename + '.tmp', 'wb') as file:
+            numpy.savez(file, **arrays)
+        os.replace(filename + '.tmp', filename)
+
+    def _upward(self, source):
+        distance = {source: 0}
+        parent = {source: None}
+        heap = [(0, source)]
+        while heap:
+            dist, node = heapq.heappop(heap)
+            if dist > distance[node]:
+                continue
+            for neighbour, weight in self._up[node]:
+                if dist + weight < distance.get(neighbour, float('inf')):
+                    distance[neighbour] = dist + weight
+                    parent[neighbour] = node
+                    heapq.heappush(heap, (dist + weight, neighbour))
+        return distance, parent
+
+    def _meet(self, source, target):
+        forward, forward_parent = self._upward(self.index[source])
+        backward, backward_parent = self._upward(self.index[target])
+        best, meeting = float('inf'), None
+        for node, dist in forward.items():
+            if node in backward and dist + backward[node] < best:
+                best, meeting = dist + backward[node], node
+        return best, meeting, forward_parent, backward_parent
+
+    def distance(self, source, target):
+        """Returns the length of a shortest path between source and target.
+
+        :param source: node
+        :param target: node
+        :return: float
+        """
+        return self._meet(source, target)[0]
+
+    def path(self, source, target):
+        """Returns a shortest path between source and target. Shortcuts are unpacked.
+
+        :param source: node
+        :param target: node
+        :return: list of nodes
+        """
+        best, meeting, forward_parent, backward_parent = self._meet(source, target)
+        if meeting is None:
+            raise ValueError('No path between {0} and {1}'.format(source, target))
+        forward = [meeting]
+        while forward_parent[forward[-1]] is not None:
+            forward.append(forward_parent[forward[-1]])
+        backward = [meeting]
+        while backward_parent[backward[-1]] is not None:
+            backward.append(backward_parent[backward[-1]])
+        nodes = list(reversed(forward)) + backward[1:]
+        result = [nodes[0]]
+        for a, b in zip(nodes, nodes[1:]):
+            result.extend(self._unpack(a, b))
+        return [self.labels[i] for i in result]
+
+    def _unpack(self, a, b):
+        if self._middle is None:
+            self._middle = dict()
+            for v in range(len(self.labels)):
+                for i in range(self.indptr[v], self.indptr[v + 1]):
+                    self._middle[v, int(self.indices[i])] = int(self.middle[i])
+        # The lower ranked node stores the edge
+        middle = self._middle[(a, b) if self.rank[a] < self.rank[b] else (b, a)]
+        if middle < 0:
+            return [b]
+        return self._unpack(a, middle) + self._unpack(middle, b)
+
+    def distances(self, source, targets=None):
+        """Returns the distances from source to targets with one upward search and one downward sweep
+        over all nodes. See "PHAST: Hardware-Accelerated Shortest Path Trees" by Daniel Delling,
+        Andrew V. Goldberg, Andreas Nowatzyk and Renato F. Werneck.
+
+        :param source: node
+        :param targets: list of nodes, defaults to all nodes
+        :return: array
+        """
+        distance = [float('inf')] * len(self.labels)
+        for node, dist in self._upward(self.index[source])[0].items():
+            distance[node] = dist
+        for v in numpy.argsort(-self.rank).tolist():
+            for u, weight in self._up[v]:
+                if distance[u] + weight < distance[v]:
+                    distance[v] = distance[u] + weight
+        distance = numpy.array(distance)
+        if targets is None:
+            return distance
+        return distance[[self.index[t] for t in targets]]
+
+
+def hierarchy(graph, filename=None):
+    """Returns the contraction hierarchy of graph. If filename is given and exists, the hierarchy is
+    read from it, as long as it was built for the same graph. Otherwise it is built and written to
+    filename.
+
+    :param graph: Graph or CompactGraph
+    :param filename: str
+    :return: ContractionHierarchy
+    """
+    graph = compact(graph)
+    if filename and os.path.exists(filename):
+        result = ContractionHierarchy.load(filename)
+        if result.fingerprint == graph.fingerprint():
+            return result
+    result = ContractionHierarchy.build(graph)
+    if filename:
+        result.save(filename)
+    return result
+
+
+def hierarchy_filename(network):
+    """Returns the file name of the hierarchy that belongs to a .network file.
+
+    :param network: str
+    :return: str
+    """
+    return '{0}.ch.npz'.format(os.path.splitext(network)[0])
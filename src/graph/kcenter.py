@@ -5,40 +5,108 @@ __author__ = 'Konstantin Weddige'
 import networkx
 import random
 import itertools
-import pulp
+import multiprocessing
+import time
 import numpy
 import scipy.optimize
+import scipy.sparse
 
-from graph import squared_graph, dominating_set, add_missing_edges
+from graph import bitmask_dominating_set, multi_source_dijkstra, update_distances
+from graph.compact import CompactGraph, compact, dijkstra, distance_matrix, squared_threshold_graph, \
+    maximal_independent_set
+from graph.landmarks import landmarks
+from utils.nearest import nearest_two, best_swap
 
 
 def objective(graph, centers):
     """Calculates the distance between nodes and centers.
 
-    :param graph: Graph
+    :param graph: Graph or CompactGraph
     :param centers: list
     :return: float
     """
     if centers:
-        # For big k networkx.floyd_warshall_numpy can be faster:
-        # distance = networkx.floyd_warshall_numpy(graph)
-        # return distance[numpy.ix_([graph.nodes().index(c) for c in centers])].min(axis=0).max(axis=1)[0,0]
-        distance = {c: networkx.bellman_ford(graph, c)[1] for c in centers}
-        return max([min([distance[c].get(n, float('inf')) for c in centers]) for n in graph.nodes_iter()])
+        if isinstance(graph, CompactGraph):
+            distance, _ = dijkstra(graph, graph.numbers(centers), min_only=True)
+            return float(distance.max())
+        distance, _ = multi_source_dijkstra(graph, centers)
+        if len(distance) < graph.number_of_nodes():
+            return float('inf')
+        return max(distance.values())
     else:
         return float("inf")
 
 
-def gonzalez(k, graph, randomized=True, heuristic=None, bellman_ford=True):
+def assignment(graph, centers):
+    """Assigns every node to its nearest center.
+
+    :param graph: Graph or CompactGraph
+    :param centers: list
+    :return: dict of distances, dict of centers
+    """
+    if isinstance(graph, CompactGraph):
+        distance, nearest = dijkstra(graph, graph.numbers(centers), min_only=True)
+        return ({node: float(distance[i]) for i, node in enumerate(graph.labels) if nearest[i] >= 0},
+                {node: graph.labels[nearest[i]] for i, node in enumerate(graph.labels) if nearest[i] >= 0})
+    return multi_source_dijkstra(graph, centers)
+
+
+def within_radius(graph, centers, radius):
+    """Checks if every node is within radius of a center. The search stops as soon as a node
+    is found beyond radius.
+
+    :param graph: Graph or CompactGraph
+    :param centers: list
+    :param radius: float
+    :return: bool
+    """
+    if not centers:
+        return False
+    if isinstance(graph, CompactGraph):
+        distance, _ = dijkstra(graph, graph.numbers(centers), limit=radius, min_only=True)
+        return bool(numpy.isfinite(distance).all())
+    distance, _ = multi_source_dijkstra(graph, centers, cutoff=radius)
+    return len(distance) == graph.number_of_nodes() and max(distance.values()) <= radius
+
+
+def gonzalez(k, graph, randomized=True, heuristic=None, bellman_ford=None, incremental=None, hierarchy=None,
+             bound=False):
     """This function gives a 2-approximation for the k-center problem on a graph.
     See "Clustering to minimize the maximum intercluster distance" by
     Teofilo F. Gonzalez for more details.
 
+    If incremental is set, the distance of every node to its nearest center is kept and updated by one
+    pruned Dijkstra run from each new center. Otherwise the distances are recomputed in every iteration,
+    either with Bellman-Ford or with A* and the given heuristic. Without heuristic, A* uses the landmark
+    lower bounds of the graph (see graph.landmarks), which also allow to skip centers that can not be
+    the nearest one. By default the incremental mode is used, unless bellman_ford is False or a heuristic
+    is given, which select A* as before. A heuristic together with incremental or bellman_ford set
+    raises ValueError.
+
+    If a contraction hierarchy is given, the distances from each new center to all nodes are computed
+    with one query of the hierarchy (see ContractionHierarchy.distances) and the other options are
+    ignored. Compact graphs always use the incremental mode, with the update done by scipy.
+
+    The distance of the farthest node to the centers is known at the end of the run. It is the radius
+    of the result and, as the centers and that node have pairwise at least this distance, the optimum
+    is at least half of it. If bound is set, the distance is returned as well.
+
     :param k: int
-    :param graph: Graph
-    :return: list
+    :param graph: Graph or CompactGraph
+    :param bellman_ford: bool
+    :param incremental: bool
+    :param hierarchy: ContractionHierarchy of graph
+    :param bound: bool
+    :return: list or list and float
     """
 
+    if incremental is None:
+        incremental = bellman_ford is not False and heuristic is None
+    if bellman_ford is None:
+        bellman_ford = heuristic is None
+    if heuristic is not None and (incremental or bellman_ford) and hierarchy is None:
+        raise ValueError('A heuristic is only used by A*, i.e. without incremental and bellman_ford')
+
     def distance(node, target):
         try:
             # return networkx.dijkstra_path_length(graph, node, target)
@@ -50,25 +118,115 @@ def gonzalez(k, graph, randomized=True, heuristic=None, bellman_ford=True):
         result = [random.choice(graph.nodes())]
     else:
         result = [graph.nodes()[0], ]
-    for l in range(k - 1):
+    if hierarchy is not None:
+        nearest = hierarchy.distances(result[0])
+        while True:
+            head = int(nearest.argmax())
+            radius = float(nearest[head])
+            if len(result) >= k or not radius > 0:
+                break
+            result.append(hierarchy.labels[head])
+            numpy.minimum(nearest, hierarchy.distances(hierarchy.labels[head]), out=nearest)
+        return (result, radius) if bound else result
+    if isinstance(graph, CompactGraph):
+        nearest = dijkstra(graph, graph.index[result[0]])
+        while True:
+            head = int(nearest.argmax())
+            radius = nearest[head]
+            if len(result) >= k or not radius > 0:
+                break
+            result.append(graph.labels[head])
+            # Nodes further away than head can not get closer than their current center
+            numpy.minimum(nearest, dijkstra(graph, head, limit=radius), out=nearest)
+        return (result, float(radius)) if bound else result
+    if incremental:
+        nearest = dict()
+        update_distances(graph, result[0], nearest)
+        while True:
+            head = max(graph.nodes_iter(), key=lambda n: nearest.get(n, float('inf')))
+            radius = nearest.get(head, float('inf'))
+            if len(result) >= k or not radius > 0:
+                break
+            result.append(head)
+            update_distances(graph, head, nearest)
+        return (result, radius) if bound else result
+    if heuristic is None and not bellman_ford:
+        bounds = landmarks(graph)
+        heuristic = bounds.heuristic
+    else:
+        bounds = None
+    # The last pass only determines the radius
+    for l in range(k if bound else k - 1):
         dist = 0
         head = None
         if bellman_ford:
             distance = {c: networkx.bellman_ford(graph, c)[1] for c in result}
-            head = max([
+            head, dist = max([
                 (n, min([(c, distance[c].get(n, float('inf'))) for c in result], key=lambda i: i[1])[1])
                 for n in graph.nodes_iter()
-            ], key=lambda i: i[1])[0]
+            ], key=lambda i: i[1])
         else:
             for node in graph.nodes():
-                tmp_dist = min(distance(node, target) for target in result)
+                if bounds:
+                    tmp_dist = float('inf')
+                    for lower, target in sorted((heuristic(node, target), target) for target in result):
+                        # Neither this center nor any of the following can be nearer, or the node is no candidate
+                        if lower >= tmp_dist or tmp_dist <= dist:
+                            break
+                        tmp_dist = min(tmp_dist, distance(node, target))
+                else:
+                    tmp_dist = min(distance(node, target) for target in result)
                 if tmp_dist > dist:
                     dist = tmp_dist
                     head = node
-        if head:
+        if head and len(result) < k:
             result.append(head)
         else:
-            return result
+            break
+    return (result, dist) if bound else result
+
+
+def local_search(graph, centers, iterations=100, timeout=None, candidates=16):
+    """This function improves a solution, e.g. of gonzalez, by swapping centers.
+
+    In every iteration the node that determines the radius is identified. Up to candidates nodes that
+    are closer to it than its center are tried as replacement for every center. Nearest and second nearest
+    centers are kept for all nodes, so a candidate needs one Dijkstra run and all its swaps are
+    evaluated at once. The best improving swap is applied. The search stops if there is none or if the
+    iteration or time budget is used up.
+
+    :param graph: Graph or CompactGraph
+    :param centers: list
+    :param iterations: int
+    :param timeout: float, seconds
+    :param candidates: int
+    :return: list
+    """
+    start = time.perf_counter()
+    graph = compact(graph)
+    result = list(centers)
+    distance = dijkstra(graph, graph.numbers(result)).T.copy()
+    for iteration in range(iterations):
+        if timeout is not None and time.perf_counter() - start > timeout:
+            break
+        nearest, label, second, _ = nearest_two(distance)
+        critical = int(nearest.argmax())
+        radius = nearest[critical]
+        to_critical = dijkstra(graph, critical, limit=radius)
+        pool = numpy.flatnonzero(to_critical < radius)
+        pool = pool[numpy.argsort(to_critical[pool])]
+        pool = pool[numpy.linspace(0, len(pool) - 1, min(candidates, len(pool))).astype(int)]
+        best = None
+        for candidate in pool:
+            candidate_distance = dijkstra(graph, candidate)
+            candidate_radius, j = best_swap(nearest, label, second, candidate_distance, len(result))
+            if candidate_radius < radius:
+                radius = candidate_radius
+                best = candidate, j, candidate_distance
+        if best is None:
+            break
+        candidate, j, distance[:, j] = best
+        result[j] = graph.labels[candidate]
     return result
 
 
@@ -80,123 +238,213 @@ def hochbaum_shmoys(k, graph):
     This implementation follows "k-Center in Verkehrsnetzwerken – ein Vergleich geometrischer
     und graphentheoretischer Ansätze" by Valentin Breuß.
 
+    Instead of adding one edge after another, the threshold is found by binary search over the
+    distinct edge weights. If the independent set for one weight is too large, the optimum is larger
+    than that weight. So the result is still within a factor of 2 of the optimum.
+
+    Use graph.add_missing_edges or graph.compact.metric_closure to complete a graph.
+
     :param k: int
-    :param graph: Graph
+    :param graph: Graph or CompactGraph
     :return: list
     """
-    edges = list()
-    for edge in sorted(graph.edges(data=True), key=lambda e: e[2]['weight']):
-        edges.append(edge)
-        squared = networkx.Graph(edges)
-        squared.add_nodes_from(graph.nodes())
-        squared = squared_graph(squared)
-        maximal_independent_set = networkx.maximal_independent_set(squared)
-        if len(maximal_independent_set) <= k:
-            return maximal_independent_set
-
-
-def ilhan_pinar(k, graph, sites=None, demand=None):
+    graph = compact(graph)
+    thresholds = numpy.unique(graph.weights)
+    result = None
+    low, high = 0, len(thresholds) - 1
+    while low <= high:
+        middle = (low + high) // 2
+        independent_set = maximal_independent_set(squared_threshold_graph(graph, thresholds[middle]), limit=k)
+        if independent_set is None:
+            low = middle + 1
+        else:
+            result = [graph.labels[i] for i in independent_set]
+            high = middle - 1
+    return result
+
+
+def ilhan_pinar(k, graph, sites=None, demand=None, dtype=numpy.float64, filename=None):
     """This function solves k-center on a graph.
     See "An Efficient Exact Algorithm for the Vertex p-Center Problem"
     by Taylan Ilhan and Mustafa C. Pinar for more details.
 
+    Only the distances between demand and sites are computed. See graph.compact.distance_matrix for
+    dtype and filename, which allow to keep the matrix small and to reuse it after a restart.
+
+    The optimal radius is searched by bisection over the sorted distinct distances between a lower
+    bound and the radius of a greedy solution. D is only read in chunks of rows. The LP relaxation
+    is used first to find a lower bound, then the MILP is bisected between that bound and the largest
+    distance. So the number of solver calls is logarithmic in the number of distinct distances.
+
     :param k: int
-    :param graph: Graph
+    :param graph: Graph or CompactGraph
+    :param sites: list of nodes
+    :param demand: list of nodes
+    :param dtype: numpy data type of the distance matrix
+    :param filename: str
     :return: list
     """
-    D = networkx.floyd_warshall_numpy(graph)
-    
-    reshape = False
+    graph = compact(graph)
     if not sites:
         sites = graph.nodes()
-        reshape = True
     if not demand:
         demand = graph.nodes()
-        reshape = True
-    if reshape:
-        D = D[numpy.ix_([graph.nodes().index(c) for c in demand],[graph.nodes().index(c) for c in sites])]
-    u = D.max()
-    l = D.min()
-    while True:
-        epsilon = l + (u - l)/2
-        B = 1 * (D <= epsilon)
-        #"""
-        prog = pulp.LpProblem('MILP', pulp.LpMinimize)
-        x = pulp.LpVariable.dicts('centre', range(len(sites)), 0, 1)
-        #prog += 0, 'No objective needed'
-        for j in range(len(demand)):
-            prog += pulp.lpSum([B[j,i] * x[i] for i in range(len(sites))]) >= 1, 'Reach node {0}'.format(j)
-        prog += pulp.lpSum([x[i] for i in range(len(sites))]) <= k
-        
-        prog.solve()
-        
-        if prog.status == 1: # 'Optimal'
-            u = epsilon
-        elif prog.status == -1: # 'Infeasible'
-            l = epsilon
-        else:
-            raise RuntimeError(pulp.LpStatus[prog.status])
-        """
-        A = numpy.concatenate([
-                -1 * B,
-                [[1] * B.shape[1]],
-                numpy.diag([1] * B.shape[1]),
-                numpy.diag([-1] * B.shape[1]),
-            ])
-        b = numpy.concatenate([[-1] * B.shape[0], [k] ,[1] * B.shape[1], [0] * B.shape[1]])
-        lp = scipy.optimize.linprog([0] * B.shape[1], A, b)
-
-        if lp.status == 0:
-            u = epsilon
-        elif lp.status == 2:
-            l = epsilon
+    D = distance_matrix(graph, demand, sites, dtype=dtype, filename=filename)
+    radii = _radii(D, k)
+    # The LP relaxation gives a lower bound for the index of the optimal radius
+    low, high = 0, len(radii) - 1
+    x = None
+    while low < high:
+        middle = (low + high) // 2
+        x_middle = _covering(D, radii[middle], k, start=x)
+        if x_middle is not None:
+            high = middle
+            x = x_middle
         else:
-            raise RuntimeError(lp)
-        """
-        #if u - l < 1:
-        if u < l * 1.05:
-            break
-    epsilon = l
-    while True:
-        B = 1 * (D <= epsilon)
-
-        prog = pulp.LpProblem('MILP', pulp.LpMinimize)
-        x = pulp.LpVariable.dicts('centre', range(len(sites)), 0, 1, pulp.LpInteger)
-        #prog += 0, 'No objective needed'
-        for j in range(len(demand)):
-            prog += pulp.lpSum([B[j,i] * x[i] for i in range(len(sites))]) >= 1, 'Reach node {0}'.format(j)
-        prog += pulp.lpSum([x[i] for i in range(len(sites))]) <= k
-
-        prog.solve()
-
-        # See pulp.LpStatus for status codes
-        if prog.status == 1: # 'Optimal'
-            return list(itertools.compress(sites, [var.value() for var in x.values()]))
-        elif prog.status == -1: # 'Infeasible'
-            epsilon = D[D > epsilon].min()
+            low = middle + 1
+    # The largest radius is always feasible
+    high = len(radii) - 1
+    x, x_index = None, None
+    while low < high:
+        middle = (low + high) // 2
+        x_middle = _covering(D, radii[middle], k, integral=True, start=x)
+        if x_middle is not None:
+            high = middle
+            x, x_index = x_middle, middle
         else:
-            raise RuntimeError(prog)
-            
-def sample_approximation(k, graph, m=1):
-    sites = random.sample(graph.nodes(), int(len(graph) * m))
-    ilhan_pinar(k, graph, sites=sites)
+            low = middle + 1
+    if x_index != high:
+        x = _covering(D, radii[high], k, integral=True)
+    return list(itertools.compress(sites, numpy.round(x)))
+
+
+def _chunks(D):
+    """Yields slices of rows of D that take about 16 MB as boolean arrays.
+
+    :param D: distance matrix
+    :return: iterator of slices
+    """
+    chunk_size = max(1, 2 ** 24 // max(1, D.shape[1]))
+    for start in range(0, D.shape[0], chunk_size):
+        yield slice(start, start + chunk_size)
+
+
+def _radii(D, k):
+    """Returns the sorted distinct distances that can be the optimal radius.
+
+    Every demand node needs a site, so the radius is at least the largest distance of a demand node to
+    its nearest site. Sites chosen by farthest point traversal give a feasible radius, so it is at most
+    that. Only the distances in between are collected, chunk by chunk.
+
+    :param D: distance matrix (demand x sites)
+    :param k: int
+    :return: array
+    """
+    lower = max(D[rows].min(axis=1).max() for rows in _chunks(D))
+    nearest = numpy.array(D[:, 0], dtype=numpy.float64)
+    for i in range(1, min(k, D.shape[1])):
+        site = int(numpy.argmin(D[int(nearest.argmax())]))
+        numpy.minimum(nearest, D[:, site], out=nearest)
+    upper = nearest.max()
+    radii = list()
+    for rows in _chunks(D):
+        block = numpy.asarray(D[rows])
+        radii.append(numpy.unique(block[(block >= lower) & (block <= upper)]))
+    return numpy.unique(numpy.concatenate(radii))
+
+
+def _covering(D, epsilon, k, integral=False, start=None):
+    """Solves the covering program of Ilhan and Pinar for radius epsilon with HiGHS.
+
+    The constraint matrix is built as sparse matrix from D <= epsilon, chunk by chunk. If start is a solution
+    of the program, e.g. the solution of the previous bisection step, it is returned without calling
+    the solver.
+
+    :param D: distance matrix (demand x sites)
+    :param epsilon: float
+    :param k: int
+    :param integral: bool, solve the MILP instead of its LP relaxation
+    :param start: array
+    :return: array of site variables or None if the program is infeasible
+    """
+    B = scipy.sparse.vstack([scipy.sparse.csr_matrix(D[rows] <= epsilon, dtype=numpy.float64) for rows in _chunks(D)],
+                            format='csr')
+    if start is not None and (B @ start >= 1 - 1e-9).all():
+        return start
+    if (B.getnnz(axis=1) == 0).any():
+        # Some demand node can not be reached at all
+        return None
+    sites = B.shape[1]
+    result = scipy.optimize.milp(
+        numpy.zeros(sites),  # No objective needed
+        constraints=[
+            scipy.optimize.LinearConstraint(B, lb=1),
+            scipy.optimize.LinearConstraint(numpy.ones((1, sites)), ub=k),
+        ],
+        integrality=numpy.full(sites, int(integral)),
+        bounds=scipy.optimize.Bounds(0, 1),
+    )
+    if result.status == 0:  # Optimal
+        return result.x
+    elif result.status == 2:  # Infeasible
+        return None
+    else:
+        raise RuntimeError(result.message)
+
+
+def sample_approximation(k, graph, m=0.1, samples=4, processes=None, seed=None):
+    """This function approximates k-center on a graph by solving it exactly on samples of the sites.
+
+    Every sample contains a fraction m of the nodes as sites, while all nodes remain demand nodes.
+    The samples are solved in parallel with ilhan_pinar and the best solution is returned. m and samples
+    trade speed for quality: m=1 gives the exact solution.
+
+    :param k: int
+    :param graph: Graph or CompactGraph
+    :param m: (0, 1]
+    :param samples: int
+    :param processes: int, defaults to the number of CPUs
+    :param seed: seed for the random samples
+    :return: list, radius
+    """
+    graph = compact(graph)
+    generator = random.Random(seed)
+    size = min(len(graph), max(k, int(len(graph) * m)))
+    sites = [generator.sample(graph.nodes(), size) for i in range(samples)]
+    with multiprocessing.Pool(processes) as pool:
+        results = pool.starmap(ilhan_pinar, [(k, graph, s) for s in sites])
+    radius, result = min(((objective(graph, r), r) for r in results), key=lambda i: i[0])
+    return result, radius
 
 
 def brute_force(k, graph):
-    """This function solves the k-center problem on graphs by exhaustive calculations.
+    """This function solves the k-center problem on graphs exactly.
+
+    For a given radius, the neighbourhoods of all nodes are stored as integer bitmasks and a
+    dominating set of size k is searched by branch and bound. The smallest feasible radius is found by
+    binary search over the distinct distances. This is meant for small instances.
 
     :param k: int
-    :param graph: Graph
-    :return: list
+    :param graph: Graph or CompactGraph
+    :return: list or None if there is no solution with finite radius
     """
-    graph = add_missing_edges(graph)
-    test_graph = networkx.Graph()
-    test_graph.add_nodes_from(graph.nodes())
-    for edge in sorted(graph.edges(data=True), key=lambda e: e[2]['weight']):
-        test_graph.add_edge(*edge)
-        result = dominating_set(test_graph, k)  # Das ist langsam
-        if result:
-            return result
+    graph = compact(graph)
+    D = distance_matrix(graph, graph.nodes(), graph.nodes())
+    # Infinite distances never cover a node
+    radii = numpy.unique(D[numpy.isfinite(D)])
+    weights = 1 << numpy.arange(len(graph), dtype=object)
+    result = None
+    low, high = 0, len(radii) - 1
+    while low <= high:
+        middle = (low + high) // 2
+        neighbourhoods = [int(weights[row].sum()) for row in D <= radii[middle]]
+        dominating_set = bitmask_dominating_set(neighbourhoods, k)
+        if dominating_set is None:
+            low = middle + 1
+        else:
+            result = [graph.labels[i] for i in dominating_set]
+            high = middle - 1
+    return result
 
 
 solve = ilhan_pinar
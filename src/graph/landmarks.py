@@ -0,0 +1,78 @@
+"""
+Landmark lower bounds for shortest path queries (ALT)
+"""
+__author__ = 'Konstantin Weddige'
+import weakref
+import numpy
+
+from graph.compact import compact, dijkstra
+
+_cache = weakref.WeakKeyDictionary()
+
+
+class Landmarks:
+    """Stores the exact distances from a few landmark nodes to all nodes.
+
+    By the triangle inequality, |d(l, u) - d(l, v)| is a lower bound for d(u, v) for every landmark l.
+    The maximum over all landmarks is an admissible heuristic for A*. See "Computing the Shortest Path:
+    A* Search Meets Graph Theory" by Andrew V. Goldberg and Chris Harrelson for more details.
+    """
+
+    def __init__(self, graph, count=8, seed=None):
+        """
+        The landmarks are chosen by farthest point traversal, starting from a random node.
+
+        :param graph: Graph or CompactGraph
+        :param count: int
+        :param seed: seed for the choice of the first landmark
+        """
+        graph = compact(graph)
+        self.index = graph.index
+        count = min(count, len(graph))
+        self.distance = numpy.empty((count, len(graph)))
+        self.landmarks = list()
+        nearest = numpy.full(len(graph), numpy.inf)
+        landmark = numpy.random.RandomState(seed).randint(len(graph))
+        for i in range(count):
+            self.landmarks.append(graph.labels[landmark])
+            self.distance[i] = dijkstra(graph, landmark)
+            numpy.minimum(nearest, self.distance[i], out=nearest)
+            # Nodes of other components are the farthest
+            landmark = int(nearest.argmax())
+        # Differences between infinite distances carry no information
+        self.distance[numpy.isinf(self.distance)] = numpy.nan
+
+    def heuristic(self, u, v):
+        """Returns a lower bound for the distance between u and v. This can be used as heuristic for
+        networkx.astar_path_length.
+
+        :param u: node
+        :param v: node
+        :return: float
+        """
+        difference = numpy.abs(self.distance[:, self.index[u]] - self.distance[:, self.index[v]])
+        difference = difference[~numpy.isnan(difference)]
+        return float(difference.max()) if len(difference) else 0.0
+
+    def lower_bounds(self, u):
+        """Returns lower bounds for the distances between u and all nodes.
+
+        :param u: node
+        :return: array
+        """
+        difference = numpy.abs(self.distance - self.distance[:, self.index[u], None])
+        return numpy.nan_to_num(difference, nan=0.0).max(axis=0)
+
+
+def landmarks(graph, count=8):
+    """Returns the landmarks of graph. They are computed once and cached as long as graph exists.
+    The cache does not notice changes to graph.
+
+    :param graph: Graph or CompactGraph
+    :param count: int
+    :return: Landmarks
+    """
+    cached = _cache.setdefault(graph, dict())
+    if count not in cached:
+        cached[count] = Landmarks(graph, count, seed=0)
+    return cached[count]
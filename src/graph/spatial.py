@@ -0,0 +1,174 @@
+"""
+Spatial indices for node positions and edges of geometric graphs
+"""
+__author__ = 'Konstantin Weddige'
+import math
+import collections
+
+# Relative to the cell size
+_TOLERANCE = 1e-9
+
+
+class SegmentGrid:
+    """A uniform grid over line segments.
+
+    Every segment is registered in the cells it passes through. A query walks the cells of the query
+    segment from one end to the other and yields the segments found there lazily, so a caller looking
+    for a single crossing can stop early. The grid is unbounded and can be updated incrementally.
+    """
+
+    def __init__(self, cell_size):
+        """
+        :param cell_size: positive number
+        """
+        self.cell_size = cell_size
+        self._cells = collections.defaultdict(set)
+        self._segments = dict()
+
+    @classmethod
+    def from_graph(cls, graph, cell_size):
+        """Builds an index of all edges of graph. Nodes need a pos attribute.
+
+        :param graph: Graph
+        :param cell_size: positive number
+        :return: SegmentGrid
+        """
+        index = cls(cell_size)
+        for x, y in graph.edges_iter():
+            index.add(x, y, graph.node[x]['pos'], graph.node[y]['pos'])
+        return index
+
+    def __len__(self):
+        return len(self._segments)
+
+    def _walk(self, a, b):
+        """Yields the cells the segment from a to b passes through, ordered from a to b. Cells that
+        the segment only touches within a small tolerance are included as well.
+        """
+        size = self.cell_size
+        first, last = math.floor(a[0] / size), math.floor(b[0] / size)
+        step = 1 if last >= first else -1
+        slope = (b[1] - a[1]) / (b[0] - a[0]) if first != last else 0
+        for i in range(first, last + step, step):
+            # The part of the segment within column i
+            start = a[0] if i == first else (i if step > 0 else i + 1) * size
+            stop = b[0] if i == last else (i + 1 if step > 0 else i) * size
+            y0 = a[1] if i == first else a[1] + slope * (start - a[0])
+            y1 = b[1] if i == last else a[1] + slope * (stop - a[0])
+            if y0 <= y1:
+                rows = range(math.floor(y0 / size - _TOLERANCE), math.floor(y1 / size + _TOLERANCE) + 1)
+            else:
+                rows = range(math.floor(y0 / size + _TOLERANCE), math.floor(y1 / size - _TOLERANCE) - 1, -1)
+            for j in rows:
+                yield i, j
+
+    def add(self, x, y, a, b):
+        """Adds the edge (x, y) from position a to position b.
+
+        :param x: node
+        :param y: node
+        :param a: (float, float)
+        :param b: (float, float)
+        """
+        key = frozenset((x, y))
+        if key in self._segments:
+            return
+        self._segments[key] = ((x, y), a, b)
+        for cell in self._walk(a, b):
+            self._cells[cell].add((x, y))
+
+    def remove(self, x, y):
+        """Removes the edge (x, y).
+
+        :param x: node
+        :param y: node
+        """
+        edge, a, b = self._segments.pop(frozenset((x, y)))
+        for cell in self._walk(a, b):
+            self._cells[cell].discard(edge)
+
+    def query(self, a, b):
+        """Yields the edges that share a cell with the segment from a to b, starting with the cells
+        next to a. Every edge is yielded once.
+
+        :param a: (float, float)
+        :param b: (float, float)
+        :return: iterator of edges
+        """
+        seen = set()
+        for cell in self._walk(a, b):
+            for edge in self._cells.get(cell, ()):
+                if edge not in seen:
+                    seen.add(edge)
+                    yield edge
+
+
+class PointGrid:
+    """A uniform grid of buckets for radius queries over points.
+
+    The grid is unbounded and points can be added at any time. A query only looks at the buckets
+    overlapping the query circle. Results are returned in insertion order.
+    """
+
+    def __init__(self, cell_size):
+        """
+        :param cell_size: positive number
+        """
+        self.cell_size = cell_size
+        self._cells = collections.defaultdict(list)
+        self._points = dict()
+        self._counter = 0
+
+    @classmethod
+    def from_graph(cls, graph, cell_size):
+        """Builds an index of all nodes of graph. Nodes need a pos attribute.
+
+        :param graph: Graph
+        :param cell_size: positive number
+        :return: PointGrid
+        """
+        index = cls(cell_size)
+        for x, data in graph.nodes_iter(data=True):
+            index.add(x, data['pos'])
+        return index
+
+    def __len__(self):
+        return len(self._points)
+
+    def _cell(self, a):
+        return math.floor(a[0] / self.cell_size), math.floor(a[1] / self.cell_size)
+
+    def add(self, x, a):
+        """Adds node x at position a.
+
+        :param x: node
+        :param a: (float, float)
+        """
+        self._points[x] = (self._counter, a)
+        self._cells[self._cell(a)].append((self._counter, x, a))
+        self._counter += 1
+
+    def remove(self, x):
+        """Removes node x.
+
+        :param x: node
+        """
+        number, a = self._points.pop(x)
+        cell = self._cells[self._cell(a)]
+        cell.remove((number, x, a))
+
+    def query(self, a, r):
+        """Returns the nodes with distance less than r to position a.
+
+        :param a: (float, float)
+        :param r: positive number
+        :return: list of nodes
+        """
+        result = list()
+        for i in range(math.floor((a[0] - r) / self.cell_size), math.floor((a[0] + r) / self.cell_size) + 1):
+            for j in range(math.floor((a[1] - r) / self.cell_size), math.floor((a[1] + r) / self.cell_size) + 1):
+                for number, x, b in self._cells.get((i, j), ()):
+                    if math.sqrt((a[0] - b[0])**2 + (a[1] - b[1])**2) < r:
+                        result.append((number, x))
+        result.sort()
+        return [x for number, x in result]
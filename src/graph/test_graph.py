@@ -1,10 +1,16 @@
 __author__ = 'Konstantin Weddige'
 import unittest
+import os
+import tempfile
 
 import networkx
 import networkx.generators.random_graphs
 
 import graph
+import graph.compact
+import graph.spatial
+import graph.landmarks
+import graph.hierarchy
 
 
 class TestGraph(unittest.TestCase):
@@ -20,5 +26,147 @@ class TestGraph(unittest.TestCase):
         output = graph.dominating_set(input, 3)
         self.assertIsNone(output)
 
+    def test_multi_source_dijkstra(self):
+        input = networkx.generators.path_graph(10)
+        distance, label = graph.multi_source_dijkstra(input, [0, 9])
+        self.assertEqual(distance[4], 4)
+        self.assertEqual(label[4], 0)
+        self.assertEqual(distance[6], 3)
+        self.assertEqual(label[6], 9)
+        distance, label = graph.multi_source_dijkstra(input, [0], cutoff=3)
+        self.assertEqual(max(distance.values()), 4)
+        self.assertLess(len(distance), 10)
+
+    def test_update_distances(self):
+        input = networkx.generators.path_graph(10)
+        distance, label = graph.multi_source_dijkstra(input, [0])
+        updated = graph.update_distances(input, 9, distance, label)
+        self.assertEqual(sorted(updated), [5, 6, 7, 8, 9])
+        self.assertEqual(distance, graph.multi_source_dijkstra(input, [0, 9])[0])
+        self.assertEqual(label[6], 9)
+
+    def test_compact_graph(self):
+        input = networkx.generators.cycle_graph(10)
+        output = graph.compact.CompactGraph.from_networkx(input)
+        self.assertEqual(output.number_of_nodes(), 10)
+        self.assertEqual(output.number_of_edges(), 10)
+        self.assertEqual(sorted(output.neighbors(0)[0]), [1, 9])
+        distance = graph.compact.dijkstra(output, [0])
+        self.assertEqual(distance.max(), 5)
+        with self.assertRaises(AttributeError):
+            output.labels = []
+
+    def test_squared_threshold_graph(self):
+        input = graph.compact.compact(networkx.generators.cycle_graph(10))
+        squared = graph.compact.squared_threshold_graph(input, 1)
+        self.assertEqual(sorted(squared.indices[squared.indptr[0]:squared.indptr[1]]), [0, 1, 2, 8, 9])
+        self.assertEqual(graph.compact.maximal_independent_set(squared), [0, 3, 6])
+        self.assertIsNone(graph.compact.maximal_independent_set(squared, limit=2))
+
+    def test_distance_matrix(self):
+        input = graph.compact.compact(networkx.generators.path_graph(10))
+        output = graph.compact.distance_matrix(input, [0, 1, 2], [9, 5], chunk_size=1)
+        self.assertEqual(output.tolist(), [[9, 5], [8, 4], [7, 3]])
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'distance.npy')
+            output = graph.compact.distance_matrix(input, [9, 5], [0, 1, 2], filename=filename)
+            self.assertEqual(output.tolist(), [[9, 8, 7], [5, 4, 3]])
+            self.assertTrue(os.path.exists(filename))
+            del output
+            # The file is only reused for the same graph, rows and columns
+            output = graph.compact.distance_matrix(input, [9, 5], [3, 4, 6], filename=filename)
+            self.assertEqual(output.tolist(), [[6, 5, 3], [2, 1, 1]])
+            del output
+            cycle = graph.compact.compact(networkx.generators.cycle_graph(10))
+            output = graph.compact.distance_matrix(cycle, [9, 5], [3, 4, 6], filename=filename)
+            self.assertEqual(output.tolist(), [[4, 5, 3], [2, 1, 1]])
+            del output
+            output = graph.compact.distance_matrix(cycle, [9, 5], [3, 4, 6], filename=filename)
+            self.assertEqual(output.tolist(), [[4, 5, 3], [2, 1, 1]])
+            del output
+
+    def test_metric_closure(self):
+        input = graph.compact.compact(networkx.generators.cycle_graph(10))
+        output = graph.compact.metric_closure(input, processes=1)
+        self.assertEqual(output.number_of_edges(), 45)
+        self.assertEqual(output.weights.max(), 5)
+
+    def test_edge_crossings(self):
+        input = networkx.Graph()
+        input.add_node(0, pos=(0, 0))
+        input.add_node(1, pos=(10, 10))
+        input.add_node(2, pos=(0, 10))
+        input.add_node(3, pos=(10, 0))
+        input.add_node(4, pos=(20, 20))
+        input.add_edge(0, 1)
+        index = graph.spatial.SegmentGrid.from_graph(input, 3)
+        self.assertTrue(graph.edge_crossings(input, 2, 3, index=index))
+        self.assertFalse(graph.edge_crossings(input, 2, 4, index=index))
+        index.remove(0, 1)
+        self.assertFalse(graph.edge_crossings(input, 2, 3, index=index))
+
+    def test_segment_grid(self):
+        index = graph.spatial.SegmentGrid(1)
+        index.add(0, 1, (0.5, 0.5), (9.5, 9.5))
+        index.add(2, 3, (0.5, 2.5), (2.5, 0.5))
+        # The boxes overlap, but the segments do not share a cell
+        self.assertEqual(list(index.query((0.5, 9.5), (9.5, 0.5))), [(0, 1)])
+        self.assertEqual(list(index.query((0.5, 0.5), (0.5, 9.5))), [(0, 1), (2, 3)])
+        self.assertEqual(list(index.query((0.5, 5.5), (9.5, 5.5))), [(0, 1)])
+        index.remove(0, 1)
+        self.assertEqual(list(index.query((0.5, 9.5), (9.5, 0.5))), [])
+
+    def test_get_nodes_within(self):
+        input = networkx.Graph()
+        for i in range(10):
+            input.add_node(i, pos=(i, 0))
+        index = graph.spatial.PointGrid.from_graph(input, 2)
+        self.assertEqual(graph.get_nodes_within(input, 5, 2.5, index=index), [3, 4, 6, 7])
+        self.assertEqual(graph.get_nodes_within(input, 5, 2.5, index=index), graph.get_nodes_within(input, 5, 2.5))
+
+    def test_random_planar_graphs(self):
+        output = graph.erdos_renyi_random_planar_graph(50, p=0.3, seed=1)
+        self.assertFalse(graph.edge_crossings(output))
+        self.assertEqual(output.edges(), graph.erdos_renyi_random_planar_graph(50, p=0.3, seed=1).edges())
+        output = graph.delaunay_random_planar_graph(1000, seed=1)
+        self.assertEqual(output.positions.shape, (1000, 2))
+        self.assertEqual(output.indices.tolist(), graph.delaunay_random_planar_graph(1000, seed=1).indices.tolist())
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'graph.npz')
+            output.save(filename)
+            self.assertEqual(graph.compact.CompactGraph.load(filename).weights.tolist(), output.weights.tolist())
+
+    def test_landmarks(self):
+        input = networkx.generators.cycle_graph(10)
+        output = graph.landmarks.Landmarks(input, count=3, seed=0)
+        for u in input.nodes():
+            bounds = output.lower_bounds(u)
+            for v in input.nodes():
+                distance = networkx.shortest_path_length(input, u, v)
+                self.assertLessEqual(output.heuristic(u, v), distance)
+                self.assertEqual(bounds[v], output.heuristic(u, v))
+        self.assertIs(graph.landmarks.landmarks(input), graph.landmarks.landmarks(input))
+
+    def test_hierarchy(self):
+        input = networkx.generators.grid_2d_graph(5, 5)
+        output = graph.hierarchy.ContractionHierarchy.build(input)
+        distances = output.distances((0, 0), [(4, 4), (2, 3)])
+        self.assertEqual(distances.tolist(), [8, 5])
+        for target in input.nodes():
+            distance = networkx.shortest_path_length(input, (0, 0), target)
+            self.assertEqual(output.distance((0, 0), target), distance)
+            path = output.path((0, 0), target)
+            self.assertEqual(len(path) - 1, distance)
+            self.assertTrue(all(input.has_edge(a, b) for a, b in zip(path, path[1:])))
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'grid.ch.npz')
+            graph.hierarchy.hierarchy(input, filename)
+            self.assertEqual(os.listdir(directory), ['grid.ch.npz'])
+            self.assertEqual(graph.hierarchy.hierarchy(input, filename).distance((0, 0), (4, 4)), 8)
+            # A file of another graph with the same number of nodes is not reused
+            input.add_edge((0, 0), (4, 4), weight=1)
+            self.assertEqual(graph.hierarchy.hierarchy(input, filename).distance((0, 0), (4, 4)), 1)
+            self.assertEqual(graph.hierarchy.ContractionHierarchy.load(filename).distance((0, 0), (4, 4)), 1)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
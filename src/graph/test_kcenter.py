@@ -0,0 +1,137 @@
+__author__ = 'Konstantin Weddige'
+import unittest
+import unittest.mock
+import os
+
+import networkx
+
+import graph
+import graph.kcenter
+import graph.dynamic
+import graph.hierarchy
+import graph.compact
+
+RANDOM = os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'Random.network')
+
+
+class TestKCenter(unittest.TestCase):
+    def setUp(self):
+        self.graph = networkx.read_gpickle(RANDOM)
+
+    def test_brute_force(self):
+        input = networkx.generators.cycle_graph(10)
+        output = graph.kcenter.brute_force(3, input)
+        self.assertLessEqual(len(output), 3)
+        self.assertEqual(graph.kcenter.objective(input, output), 2)
+        # Three components can not be covered by two centers
+        input = networkx.Graph([(0, 1), (2, 3)])
+        input.add_node(4)
+        self.assertIsNone(graph.kcenter.brute_force(2, input))
+
+    def test_assignment(self):
+        centers = graph.kcenter.gonzalez(4, self.graph, randomized=False)
+        lengths = {c: networkx.single_source_dijkstra_path_length(self.graph, c) for c in centers}
+        for input in (self.graph, graph.compact.compact(self.graph)):
+            distance, label = graph.kcenter.assignment(input, centers)
+            self.assertEqual(set(distance), set(self.graph.nodes()))
+            for node in self.graph.nodes_iter():
+                self.assertAlmostEqual(distance[node], min(lengths[c][node] for c in centers))
+                self.assertAlmostEqual(lengths[label[node]][node], distance[node])
+
+    def test_within_radius(self):
+        input = networkx.generators.path_graph(1000)
+        # The search stops at the first node beyond the radius
+        distance, _ = graph.multi_source_dijkstra(input, [0], cutoff=2)
+        self.assertEqual(sorted(distance), [0, 1, 2, 3])
+        for input in (input, graph.compact.compact(input)):
+            self.assertTrue(graph.kcenter.within_radius(input, [0, 999], 499))
+            self.assertFalse(graph.kcenter.within_radius(input, [0, 999], 498))
+            self.assertFalse(graph.kcenter.within_radius(input, [], 1000))
+        input = networkx.Graph([(0, 1), (2, 3)])
+        self.assertFalse(graph.kcenter.within_radius(input, [0], 10))
+        self.assertFalse(graph.kcenter.within_radius(graph.compact.compact(input), [0], 10))
+        self.assertTrue(graph.kcenter.within_radius(input, [0, 2], 1))
+
+    def test_ilhan_pinar(self):
+        for k in (2, 4):
+            optimum = graph.kcenter.objective(self.graph, graph.kcenter.brute_force(k, self.graph))
+            output = graph.kcenter.ilhan_pinar(k, self.graph)
+            self.assertLessEqual(len(output), k)
+            self.assertAlmostEqual(graph.kcenter.objective(self.graph, output), optimum)
+
+    def test_approximations(self):
+        hierarchy = graph.hierarchy.ContractionHierarchy.build(self.graph)
+        for k in (2, 4):
+            optimum = graph.kcenter.objective(self.graph, graph.kcenter.brute_force(k, self.graph))
+            output, radius = graph.kcenter.gonzalez(k, self.graph, bound=True)
+            self.assertAlmostEqual(graph.kcenter.objective(self.graph, output), radius)
+            self.assertLessEqual(radius, 2 * optimum)
+            output = graph.kcenter.gonzalez(k, self.graph, randomized=False, hierarchy=hierarchy)
+            self.assertEqual(output, graph.kcenter.gonzalez(k, self.graph, randomized=False))
+            # Hochbaum-Shmoys requires a complete graph
+            output = graph.kcenter.hochbaum_shmoys(k, graph.add_missing_edges(self.graph))
+            self.assertLessEqual(len(output), k)
+            self.assertLessEqual(graph.kcenter.objective(self.graph, output), 2 * optimum)
+
+    def test_gonzalez_passes(self):
+        expected = graph.kcenter.gonzalez(4, self.graph, randomized=False, bound=True)
+        with unittest.mock.patch('networkx.bellman_ford', wraps=networkx.bellman_ford) as bellman_ford:
+            output = graph.kcenter.gonzalez(4, self.graph, randomized=False, incremental=False)
+            # One run per center and pass, without a pass after the last center
+            self.assertEqual(bellman_ford.call_count, 1 + 2 + 3)
+            self.assertEqual(output, expected[0])
+            output, radius = graph.kcenter.gonzalez(4, self.graph, randomized=False, incremental=False, bound=True)
+            self.assertEqual(output, expected[0])
+            self.assertAlmostEqual(radius, expected[1])
+
+    def test_gonzalez_modes(self):
+        expected = graph.kcenter.gonzalez(4, self.graph, randomized=False)
+        self.assertEqual(graph.kcenter.gonzalez(4, self.graph, randomized=False, bellman_ford=False), expected)
+        zero = lambda u, v: 0
+        self.assertEqual(graph.kcenter.gonzalez(4, self.graph, randomized=False, heuristic=zero), expected)
+        self.assertEqual(graph.kcenter.gonzalez(4, self.graph, randomized=False, bellman_ford=False, heuristic=zero),
+                         expected)
+        with self.assertRaises(ValueError):
+            graph.kcenter.gonzalez(4, self.graph, incremental=True, heuristic=zero)
+        # Compact graphs do not need landmarks
+        with unittest.mock.patch('graph.kcenter.landmarks') as landmarks:
+            output = graph.kcenter.gonzalez(4, graph.compact.compact(self.graph), randomized=False, bellman_ford=False)
+            self.assertFalse(landmarks.called)
+        self.assertEqual(output, expected)
+
+    def test_sample_approximation(self):
+        output, radius = graph.kcenter.sample_approximation(3, self.graph, m=0.2, samples=2, processes=2, seed=1)
+        self.assertLessEqual(len(output), 3)
+        self.assertAlmostEqual(radius, graph.kcenter.objective(self.graph, output))
+        self.assertEqual(graph.kcenter.sample_approximation(3, self.graph, m=0.2, samples=2, processes=2, seed=1),
+                         (output, radius))
+
+    def test_local_search(self):
+        centers = graph.kcenter.gonzalez(4, self.graph, randomized=False)
+        output = graph.kcenter.local_search(self.graph, centers)
+        self.assertEqual(len(output), 4)
+        self.assertLessEqual(graph.kcenter.objective(self.graph, output),
+                             graph.kcenter.objective(self.graph, centers))
+
+    def test_dynamic(self):
+        centers = graph.kcenter.gonzalez(4, self.graph, randomized=False)
+        dynamic = graph.dynamic.DynamicKCenter(self.graph, centers)
+        edges = self.graph.edges()
+        dynamic.update([(u, v, 10 * self.graph[u][v]['weight']) for u, v in edges[::7]])
+        dynamic.update([(u, v, self.graph[u][v]['weight'] / 20) for u, v in edges[::5]])
+        dynamic.update([(u, v, None) for u, v in edges[::11]])
+        # Edges changed twice in one batch: decreased then increased, removed then added again
+        edges = self.graph.edges()
+        dynamic.update([(u, v, 0.01) for u, v in edges[1::13]] + [(u, v, 1000) for u, v in edges[1::13]])
+        dynamic.update([(u, v, None) for u, v in edges[2::13]] + [(u, v, 100) for u, v in edges[2::13]])
+        distance, _ = graph.multi_source_dijkstra(self.graph, centers)
+        self.assertEqual(set(distance), set(dynamic.distance))
+        for node in distance:
+            self.assertAlmostEqual(distance[node], dynamic.distance[node])
+        if len(distance) == self.graph.number_of_nodes():
+            self.assertAlmostEqual(dynamic.radius, max(distance.values()))
+        else:
+            self.assertEqual(dynamic.radius, float('inf'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -8,6 +8,7 @@ import logging
 import argparse
 import operator
 import time
+import threading
 
 import copy
 import matplotlib
@@ -32,6 +33,8 @@ import utm
 
 import geometry.kcenter
 import graph.kcenter
+import graph.hierarchy
+import graph.compact
 
 logger = logging.getLogger(__name__)
 
@@ -61,10 +64,6 @@ def resolve_args(algorithm, *args):
     return result
 
 
-def nearest_center(point, centers):
-    return min(range(len(centers)), key=lambda i: math.hypot((point[0] - centers[i][0]), (point[1] - centers[i][1])))
-
-
 def plot_small_geometric(task):
     args = resolve_args(task._algorithm, *task._args)
     points = args[1]
@@ -82,7 +81,8 @@ def plot_small_geometric(task):
 
     x = [p[0] for p in points]
     y = [p[1] for p in points]
-    colors = [COLORS[nearest_center(p, task._result)] for p in points]
+    _, label, _ = geometry.kcenter.assign(points, task._result)
+    colors = [COLORS[i] for i in label]
 
     minx = min(x)
     maxx = max(x)
@@ -127,7 +127,8 @@ def plot_big_geometric(task):
 
     x = [p[0] for p in points]
     y = [p[1] for p in points]
-    colors = [CENTER_COLORS[nearest_center(p, task._result)] for p in points]
+    _, label, _ = geometry.kcenter.assign(points, task._result)
+    colors = [CENTER_COLORS[i] for i in label]
 
     minx = min(x)
     maxx = max(x)
@@ -156,10 +157,11 @@ def plot_small_graph(task):
     args = resolve_args(task._algorithm, *task._args)
     data = args[1]
 
+    hierarchy = graph_hierarchy(task._args[1])
+
     def nearest_center(node, centers):
         logger.debug(node, centers)
-        return min(range(len(centers)),
-                   key=lambda i: networkx.shortest_path_length(data, node, centers[i], weight='weight'))
+        return min(range(len(centers)), key=lambda i: hierarchy.distance(node, centers[i]))
 
     fig = pylab.figure(figsize=(5, 5))
     pylab.axis('off')
@@ -177,7 +179,7 @@ def plot_small_graph(task):
         else:
             center = nearest_center(n, task._result)
             node_colors.append(COLORS[center])
-            shortest_path = networkx.shortest_path(data, n, task._result[center], weight='weight')
+            shortest_path = hierarchy.path(n, task._result[center])
             for i in range(len(shortest_path) - 1):
                 try:
                     width[data.edges().index((shortest_path[i], shortest_path[i + 1]))] = 3
@@ -227,11 +229,8 @@ def plot_big_graph(task):
     for c in task._result:
         nodes.remove(c)
 
-    distance = {c: networkx.bellman_ford(data, c)[1] for c in task._result}
-    node_colors = [
-        COLORS[min(range(len(task._result)), key=lambda i: distance[task._result[i]].get(n, float('inf')))]
-        for n in nodes
-    ]
+    _, label = graph.kcenter.assignment(data, task._result)
+    node_colors = [COLORS[task._result.index(label[n])] for n in nodes]
 
     networkx.draw_networkx(data, pos, with_labels=False, node_size=5, nodelist=nodes, node_color=node_colors,
                            linewidths=0)
@@ -332,12 +331,37 @@ COLORS = CENTER_COLORS
 #               '#9fffc3', '#dbbe00', '#bef700', '#ff00da', '#0089ff', '#ffc105', '#ffbfd4', '#82ca00', '#ff0016',
 #               '#68ffff', '#00e6d7', '#eaff6a', '#c310ff', '#ff0000', '#ffff82', '#ffff00', '#ff6a06']
 
-GRAPH_INSTANCES = {
-    'random': networkx.read_gpickle('../data/Random.network'),
-    'muenchen': networkx.read_gpickle('../data/Muenchen.reduced.network'),
-    'muenchen centre': networkx.read_gpickle('../data/Muenchen.centre.reduced.network'),
+GRAPH_FILES = {
+    'random': '../data/Random.network',
+    'muenchen': '../data/Muenchen.reduced.network',
+    'muenchen centre': '../data/Muenchen.centre.reduced.network',
 }
 
+GRAPH_INSTANCES = {instance: networkx.read_gpickle(filename) for instance, filename in GRAPH_FILES.items()}
+
+_hierarchies = dict()
+_hierarchies_lock = threading.Lock()
+_compact_instances = dict()
+_compact_instances_lock = threading.Lock()
+
+
+def graph_hierarchy(instance):
+    # The hierarchy is built once and stored next to the .network file. Tasks run on a thread pool, so
+    # the lock keeps two of them from building it at the same time.
+    with _hierarchies_lock:
+        if instance not in _hierarchies:
+            _hierarchies[instance] = graph.hierarchy.hierarchy(
+                GRAPH_INSTANCES[instance], graph.hierarchy.hierarchy_filename(GRAPH_FILES[instance]))
+        return _hierarchies[instance]
+
+
+def graph_compact(instance):
+    with _compact_instances_lock:
+        if instance not in _compact_instances:
+            _compact_instances[instance] = graph.compact.compact(GRAPH_INSTANCES[instance])
+        return _compact_instances[instance]
+
+
 GRAPH_PLOTTER = {
     'random': plot_small_graph,
     'muenchen': plot_big_graph,
@@ -388,6 +412,8 @@ ALGORITHMS = {
     'Gonzalez (euclidean)': {
         'algorithm': geometry.kcenter.gonzalez,
         'objective': geometry.kcenter.objective,
+        # The algorithm also returns the radius of its result, which bounds the optimum
+        'bound': True,
         'plotter': GEOMETRIC_PLOTTER,
         'args': [
             range(1, len(CENTER_COLORS) + 1),
@@ -409,6 +435,11 @@ ALGORITHMS = {
     'Gonzalez (metric)': {
         'algorithm': graph.kcenter.gonzalez,
         'objective': graph.kcenter.objective,
+        # The algorithm also returns the radius of its result, which bounds the optimum
+        'bound': True,
+        # The algorithm runs on the compact version of the instance. Its Dijkstra runs are faster than
+        # queries on the contraction hierarchy.
+        'compact': True,
         'plotter': GRAPH_PLOTTER,
         'args': [
             range(1, len(CENTER_COLORS) + 1),
@@ -611,12 +642,20 @@ class Task:
             logger.debug('Start {0}'.format(self.uuid))
             self.state = 'started'
             self._start = time.clock()
+            args = resolve_args(self._algorithm, *self._args)
+            options = dict()
+            if ALGORITHMS[self._algorithm].get('bound'):
+                options['bound'] = True
+            if ALGORITHMS[self._algorithm].get('compact'):
+                # This expects the instance to be the second argument
+                args[1] = graph_compact(self._args[1])
             return timeout_decorator.timeout(
                 TIMEOUT * 60, use_signals=False
             )(
                 ALGORITHMS[self._algorithm]['algorithm']
             )(
-                *resolve_args(self._algorithm, *self._args)
+                *args,
+                **options
             )
 
         _workers.apply_async(_run, callback=self._on_finished, error_callback=self._on_error)
@@ -625,15 +664,21 @@ class Task:
 
     def _on_finished(self, result):
         self._stop = time.clock()
-        self._result = result
-        logger.info('Compute objective for {0}'.format(self.uuid))
-        # This expects the instance to be the second argument
-        args = resolve_args(self._algorithm, *self._args)
-        if self._algorithm == 'Grid approximation':
-            # A better solution for this would be nice
-            self._objective = ALGORITHMS[self._algorithm]['objective'](args[1], result, args[3])
+        self._lower_bound = None
+        if ALGORITHMS[self._algorithm].get('bound'):
+            # The radius is returned with the result and is at most twice the optimum
+            self._result, self._objective = result
+            self._lower_bound = self._objective / 2
         else:
-            self._objective = ALGORITHMS[self._algorithm]['objective'](args[1], result)
+            self._result = result
+            logger.info('Compute objective for {0}'.format(self.uuid))
+            # This expects the instance to be the second argument
+            args = resolve_args(self._algorithm, *self._args)
+            if self._algorithm == 'Grid approximation':
+                # A better solution for this would be nice
+                self._objective = ALGORITHMS[self._algorithm]['objective'](args[1], result, args[3])
+            else:
+                self._objective = ALGORITHMS[self._algorithm]['objective'](args[1], result)
         logger.info('{0} finished'.format(self.uuid))
         self.state = 'finished'
         if self._callback:
@@ -665,6 +710,7 @@ class Task:
                 'uri': application.reverse_url('task', self.uuid),
                 'result': self._result,
                 'objective': self._objective,
+                'lower_bound': self._lower_bound,
                 'img': application.reverse_url('image', self.uuid),
                 'duration': self.duration,
             }
@@ -683,6 +729,7 @@ class Task:
                 'uri': application.reverse_url('algorithm', self._algorithm, '/' + '/'.join(self._args)),
                 'result': self._result,
                 'objective': self._objective,
+                'lower_bound': self._lower_bound,
                 'img': application.reverse_url('image', self.uuid),
                 'duration': self.duration,
             }
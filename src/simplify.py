@@ -13,6 +13,7 @@ import math
 import timeit
 
 import gis
+from graph.landmarks import Landmarks
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
@@ -72,12 +73,16 @@ if __name__ == '__main__':
     print('Deleted {0} nodes'.format(nodes_discarded))
     print('{0} connected components remaining'.format(len(components)))
 
+    # Replacing a node of degree 2 by a single edge of the same length keeps all distances,
+    # so the landmark bounds stay valid while the graph is simplified
+    landmarks = Landmarks(graph)
+
     def heuristic(a, b):
         lat1 = math.radians(graph.node[a]['lat'])
         lon1 = math.radians(graph.node[a]['lon'])
         lat2 = math.radians(graph.node[b]['lat'])
         lon2 = math.radians(graph.node[b]['lon'])
-        return gis.distance(lat1, lon1, lat2, lon2)
+        return max(gis.distance(lat1, lon1, lat2, lon2), landmarks.heuristic(a, b))
 
     print('Remove short edges')
     items, edges_removed, violates_triangle_inequality = 0, 0, 0
@@ -0,0 +1,55 @@
+__author__ = 'Konstantin Weddige'
+import numpy
+
+
+def nearest_two(distance):
+    """
+    Returns the nearest and second nearest center for every point.
+
+    Example: nearest_two([[1, 2, 3], [2, 0, 1]]) -> [1, 0], [0, 1], [2, 1], [1, 2]
+
+    :param distance: array of shape (points, centers)
+    :return: nearest distance, nearest center, second nearest distance, second nearest center
+    """
+    distance = numpy.asarray(distance, dtype=numpy.float64)
+    if distance.shape[1] < 2:
+        n = distance.shape[0]
+        return distance[:, 0], numpy.zeros(n, dtype=numpy.int64), numpy.full(n, numpy.inf), numpy.full(n, -1)
+    order = numpy.argpartition(distance, 1, axis=1)[:, :2]
+    rows = numpy.arange(distance.shape[0])
+    first, second = distance[rows, order[:, 0]], distance[rows, order[:, 1]]
+    swap = second < first
+    order[swap] = order[swap][:, ::-1]
+    return distance[rows, order[:, 0]], order[:, 0], distance[rows, order[:, 1]], order[:, 1]
+
+
+def best_swap(nearest, label, second, candidate, k):
+    """
+    Evaluates all swaps of one center against a new candidate center at once.
+
+    When center j is replaced by the candidate, a point keeps its nearest center unless that was j,
+    in which case its second nearest center takes over. Either way the candidate may be nearer.
+
+    :param nearest: array of distances to the nearest center
+    :param label: array of nearest centers
+    :param second: array of distances to the second nearest center
+    :param candidate: array of distances to the candidate
+    :param k: int, number of centers
+    :return: radius and index of the best center to replace
+    """
+    kept = numpy.minimum(nearest, candidate)
+    replaced = numpy.minimum(second, candidate)
+    kept_max = numpy.full(k, -numpy.inf)
+    numpy.maximum.at(kept_max, label, kept)
+    replaced_max = numpy.full(k, -numpy.inf)
+    numpy.maximum.at(replaced_max, label, replaced)
+    # The largest kept distance of all clusters except j
+    order = numpy.argsort(kept_max)[::-1]
+    others = numpy.full(k, kept_max[order[0]])
+    if k > 1:
+        others[order[0]] = kept_max[order[1]]
+    else:
+        others[order[0]] = -numpy.inf
+    radius = numpy.maximum(others, replaced_max)
+    j = int(radius.argmin())
+    return float(radius[j]), j
@@ -0,0 +1,18 @@
+__author__ = 'Konstantin Weddige'
+import unittest
+from utils import nearest
+
+class TestNearestUtils(unittest.TestCase):
+    def test_nearest_two(self):
+        input = [[1, 2, 3], [2, 0, 1]]
+        output = [list(array) for array in nearest.nearest_two(input)]
+        self.assertEqual(output, [[1, 0], [0, 1], [2, 1], [1, 2]])
+
+    def test_best_swap(self):
+        # Points at 0, 1, 3, 8 and 9 with centers 0 and 1. Replacing center 0 by 8 gives radius 2.
+        distance = [[0, 1], [1, 0], [3, 2], [8, 7], [9, 8]]
+        first, label, second, _ = nearest.nearest_two(distance)
+        self.assertEqual(nearest.best_swap(first, label, second, [8, 7, 5, 0, 1], 2), (2, 0))
+
+if __name__ == '__main__':
+    unittest.main()